@@ -1,24 +1,133 @@
-from flask import Flask, render_template, jsonify, request, redirect, url_for, flash, session
-from models import db, init_db, Evento, Replica, Locale, Utente, Prenotazione
-from settings import DATABASE_PATH
-from sqlalchemy import func
+from flask import Flask, Blueprint, current_app, render_template, jsonify, request, redirect, url_for, flash, session, abort
+import os
+import subprocess
+import sys
+import time
+import click
+from models import db, init_db, popola_db, riconcilia_posti, Utente, Prenotazione
+from assets import configura_asset, costruisci_asset
+from bench import registra_comandi
+from broadcaster import Diffusore, flusso_eventi
+from cache import CacheLRU
+from passwords import PoolHash, PoolSaturo, hash_password, controlla_password, da_aggiornare, aggiorna_hash, converti_password_in_chiaro
+from images import configura_immagini, genera_derivate
+from throttling import FinestraScorrevole, FinestraScorrevoleSQLite
+from engine import configura_sqlite
+from metrics import configura_metriche
+from query_detector import configura_rilevatore
+from json_provider import JSONProviderVeloce, risposta_pagina_json
+from group_commit import ScritturaScaduta, avvia_group_commit, esegui_scrittura
+from queries import catalogo_eventi, versioni_eventi, etag_evento, etag_prenotazioni, prenotazioni_utente, serializza_prenotazione, cursore_prenotazione, leggi_cursore_prenotazione
+from seats import PrenotazioneRifiutata, valida_quantita, crea_prenotazione, modifica_prenotazione, cancella_prenotazione
+from settings import BASE_DIR, DATABASE_PATH, JINJA_CACHE_DIR, PRECOMPILA_TEMPLATE, BUDGET_AVVIO_MS, CACHE_REPLICHE_CAPIENZA, CACHE_CARD_CAPIENZA, RILEVA_N_PIU_UNO, LOGIN_FINESTRA, LOGIN_LIMITE_EMAIL, LOGIN_LIMITE_IP, LOGIN_CONTATORI_CONDIVISI, PROXY_FIDATI, PASSWORD_METODO_MIGRAZIONE, PASSWORD_BLOCCO_MIGRAZIONE, PASSWORD_PROCESSI_MIGRAZIONE, POOL_HASH_PROCESSI, POOL_HASH_CODA_MASSIMA, POOL_HASH_TIMEOUT, SSE_CODA_MASSIMA, SSE_KEEPALIVE, GROUP_COMMIT, EVENTI_PER_PAGINA, PRENOTAZIONI_PER_PAGINA, LIMITE_MASSIMO_PAGINA
 from forms import RegistrationForm  
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy.exc import IntegrityError
+from markupsafe import Markup
+from jinja2 import FileSystemBytecodeCache
+from werkzeug.middleware.proxy_fix import ProxyFix
 
-app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + DATABASE_PATH
-app.config['SECRET_KEY'] = 'mysecretkey'
+bp = Blueprint('main', __name__, cli_group=None)
 
-init_db(app)
 
+def create_app(config=None):
+    # Nessun lavoro sullo schema all'avvio: il database si prepara con "flask init-db" e "flask seed".
+    # config sovrascrive le impostazioni predefinite (per esempio il database dei test)
+    app = Flask(__name__)
+    app.json = JSONProviderVeloce(app)
+    os.makedirs(JINJA_CACHE_DIR, exist_ok=True)
+    app.jinja_options = {**app.jinja_options, 'bytecode_cache': FileSystemBytecodeCache(JINJA_CACHE_DIR)}
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + DATABASE_PATH
+    app.config['SECRET_KEY'] = 'mysecretkey'
+    app.config['PROXY_FIDATI'] = PROXY_FIDATI
+    app.config.update(config or {})
+    if app.config['PROXY_FIDATI']:
+        # remote_addr, scheme e host diventano quelli del client, letti dalle intestazioni dei proxy fidati
+        fidati = app.config['PROXY_FIDATI']
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=fidati, x_proto=fidati, x_host=fidati)
 
-@app.route('/registrazione', methods=['GET', 'POST'])
+    configura_sqlite()
+    db.init_app(app)
+    configura_metriche(app)
+    if RILEVA_N_PIU_UNO:
+        configura_rilevatore(app)
+    app.register_blueprint(bp)
+    configura_asset(app)
+    configura_immagini(app)
+    app.extensions['cache_repliche'] = CacheLRU(CACHE_REPLICHE_CAPIENZA)
+    app.extensions['cache_card'] = CacheLRU(CACHE_CARD_CAPIENZA)
+    app.extensions['diffusore'] = Diffusore(SSE_CODA_MASSIMA)
+    if LOGIN_CONTATORI_CONDIVISI:
+        app.extensions['tentativi_login'] = FinestraScorrevoleSQLite(LOGIN_FINESTRA)
+    else:
+        app.extensions['tentativi_login'] = FinestraScorrevole(LOGIN_FINESTRA)
+    app.extensions['pool_hash'] = PoolHash(POOL_HASH_PROCESSI, POOL_HASH_CODA_MASSIMA, POOL_HASH_TIMEOUT)
+    if GROUP_COMMIT:
+        avvia_group_commit(app)
+    if PRECOMPILA_TEMPLATE:
+        precompila_template(app)
+    return app
+
+
+def precompila_template(app):
+    # Compila tutti i template prima della prima richiesta: con il bytecode su disco
+    # i worker successivi li caricano senza ricompilarli
+    for nome in app.jinja_env.list_templates():
+        app.jinja_env.get_template(nome)
+
+
+def esegui_prenotazione(operazione, *args):
+    # Punto unico per le scritture sulle prenotazioni: dopo il commit invalida le cache dell'evento
+    # e pubblica la nuova disponibilità della replica ai client collegati allo stream
+    esito = esegui_scrittura(operazione, *args)
+    current_app.extensions['cache_repliche'].invalida(esito['evento_id'])
+    current_app.extensions['cache_card'].invalida(esito['evento_id'])
+    current_app.extensions['diffusore'].pubblica(esito['evento_id'], disponibilita(esito))
+    return esito
+
+
+def disponibilita(esito):
+    # Stato della replica dopo la scrittura, inviato allo stream e nelle risposte delle modifiche
+    return {'id': esito['id'], 'posti_disponibili': esito['posti_disponibili'], 'annullato': esito['annullato']}
+
+
+def non_modificato(etag):
+    return etag is not None and request.if_none_match.contains(etag)
+
+
+def con_etag(risposta, etag, privata=False):
+    # no-cache: il browser riusa la copia locale ma la rivalida sempre con If-None-Match.
+    # private per le risposte di un singolo utente: i proxy condivisi non le conservano
+    if etag is not None:
+        risposta.set_etag(etag)
+        risposta.headers['Cache-Control'] = 'private, no-cache' if privata else 'no-cache'
+    return risposta
+
+
+def leggi_limit(predefinito):
+    limit = request.args.get('limit', predefinito, type=int)
+    return max(1, min(limit, LIMITE_MASSIMO_PAGINA))
+
+
+@bp.app_errorhandler(PoolSaturo)
+def pool_saturo(errore):
+    # Troppi hash in coda: il client riprova invece di allungare la coda per tutti
+    return 'Servizio momentaneamente sovraccarico, riprova tra qualche secondo.', 503, {'Retry-After': '1'}
+
+
+@bp.app_errorhandler(ScritturaScaduta)
+def scrittura_scaduta(errore):
+    # Lo scrittore di gruppo non ha dato l'esito in tempo. Se l'operazione era ancora in coda è stata
+    # ritirata, se era già nel lotto in corso può essere comunque registrata
+    return jsonify({
+        'error': 'Non è stato possibile confermare l\'operazione in tempo: controlla le tue prenotazioni prima di riprovare.'
+    }), 503, {'Retry-After': '1'}
+
+
+@bp.route('/registrazione', methods=['GET', 'POST'])
 def registrazione():
-    print("Funzione di registrazione chiamata")  
     form = RegistrationForm()
     if form.validate_on_submit():
-        print("Form convalidato") 
-        hashed_password = generate_password_hash(form.password.data, method='pbkdf2:sha256')
+        hashed_password = hash_password(form.password.data)
         new_utente = Utente(
             nome=form.nome.data,
             cognome=form.cognome.data,
@@ -28,107 +137,152 @@ def registrazione():
         db.session.add(new_utente)
         db.session.commit()
         flash('Account creato con successo! Ora puoi effettuare il login.', 'success')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
     return render_template('registrazione.html', form=form)
 
 
-@app.route('/')
+@bp.route('/')
 def index():
-    eventi = Evento.query.all()
-    eventi_data = []
-    for evento in eventi:
-        repliche_data = []
-        for replica in evento.rel_repliche:
-            posti_prenotati = db.session.query(func.sum(Prenotazione.quantita)).filter_by(replica_id=replica.id).scalar() or 0
-            posti_disponibili = evento.rel_locale.posti - posti_prenotati
-            repliche_data.append({
-                'id': replica.id,
-                'data_ora': replica.data_ora,
-                'annullato': replica.annullato,
-                'posti_disponibili': posti_disponibili
-            })
-        eventi_data.append({
-            'id': evento.id,
-            'nome_evento': evento.nome_evento,
-            'locale': evento.rel_locale.nome_locale,
-            'repliche': repliche_data,
-            'image_url': evento.image_url 
-        })
-    return render_template('index.html', eventi=eventi_data)
-
-
-@app.route('/login', methods=['GET', 'POST'])
+    after = request.args.get('after', type=int)
+    limit = leggi_limit(EVENTI_PER_PAGINA)
+    versioni, prossimo = versioni_eventi(after=after, limit=limit)
+    return render_template('index.html', eventi=card_eventi(versioni), prossimo=prossimo)
+
+
+def card_eventi(versioni):
+    # Le card in cache valgono finché la versione di disponibilità dell'evento non cambia:
+    # si legge dal catalogo e si renderizza solo quello che manca
+    cache = current_app.extensions['cache_card']
+    card = {}
+    for voce in versioni:
+        in_cache = cache.get(voce['id'])
+        if in_cache is not None and in_cache[0] == voce['versione']:
+            card[voce['id']] = in_cache[1]
+    mancanti = {voce['id']: voce['versione'] for voce in versioni if voce['id'] not in card}
+    if mancanti:
+        template = current_app.jinja_env.get_template('card_evento.html')
+        for evento in catalogo_eventi(id_eventi=list(mancanti)):
+            card[evento['id']] = Markup(template.render(evento=evento))
+            cache.set(evento['id'], (mancanti[evento['id']], card[evento['id']]))
+    return [{'id': voce['id'], 'html': card[voce['id']]} for voce in versioni if voce['id'] in card]
+
+
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         email = request.form.get('email')
         password = request.form.get('password')
+        # I tentativi oltre il limite si rifiutano prima di cercare l'utente e calcolare l'hash.
+        # Dietro un proxy remote_addr è l'IP del client solo con PROXY_FIDATI configurato
+        tentativi = current_app.extensions['tentativi_login']
+        chiavi = ((f"email:{(email or '').strip().lower()}", LOGIN_LIMITE_EMAIL), (f'ip:{request.remote_addr}', LOGIN_LIMITE_IP))
+        if any(tentativi.stima(chiave) >= limite for chiave, limite in chiavi):
+            flash('Troppi tentativi di accesso. Riprova tra qualche minuto.', 'danger')
+            return render_template('login.html'), 429, {'Retry-After': str(LOGIN_FINESTRA)}
         user = Utente.query.filter_by(email=email).first()
-        if user and check_password_hash(user.password, password):
+        if user and controlla_password(user.password, password):
+            if da_aggiornare(user.password):
+                # La password in chiaro è disponibile solo qui: si porta l'hash alla politica attuale
+                try:
+                    aggiorna_hash(user.id, user.password, password)
+                except PoolSaturo:
+                    pass
+            tentativi.azzera(chiavi[0][0])
             session['user_id'] = user.id
             session['user_name'] = f"{user.nome} {user.cognome}"
             flash(f'Benvenuto, {session["user_name"]}! Login effettuato con successo.', 'success')
-            return redirect(url_for('index'))
+            return redirect(url_for('main.index'))
         else:
+            for chiave, _ in chiavi:
+                tentativi.registra(chiave)
             flash('Login fallito. Controlla email e password.', 'danger')
     return render_template('login.html')
 
 
 
-@app.route('/prenotazioni')
+@bp.route('/prenotazioni')
 def prenotazioni():
     if 'user_id' not in session:
         flash('Per favore, effettua il login per accedere a questa pagina.', 'warning')
-        return redirect(url_for('login', next=request.url))
+        return redirect(url_for('main.login', next=request.url))
     return render_template('prenotazioni.html')
 
 
-@app.route('/api/repliche/<int:evento_id>')
+@bp.route('/api/repliche/<int:evento_id>')
 def get_repliche(evento_id):
-    evento = Evento.query.get_or_404(evento_id)
-    repliche = []
-    for replica in evento.rel_repliche:
-        posti_prenotati = db.session.query(func.sum(Prenotazione.quantita)).filter_by(replica_id=replica.id).scalar() or 0
-        posti_disponibili = evento.rel_locale.posti - posti_prenotati
-        repliche.append({
-            'id': replica.id,
-            'data_ora': replica.data_ora.strftime('%d-%m-%Y %H:%M'),
-            'annullato': replica.annullato,
-            'posti_disponibili': posti_disponibili
-        })
+    # L'ETag deriva dalle versioni delle repliche: con If-None-Match valido
+    # si risponde 304 senza calcolare la disponibilità
+    etag = etag_evento(evento_id)
+    if non_modificato(etag):
+        return con_etag(current_app.response_class(status=304), etag)
+    cache = current_app.extensions['cache_repliche']
+    voce = cache.get(evento_id)
+    if voce is not None and voce[0] != etag:
+        voce = None
+    if voce is None:
+        eventi_data = catalogo_eventi(evento_id)
+        if not eventi_data:
+            abort(404)
+        evento = eventi_data[0]
+        dati = {
+            'nome_evento': evento['nome_evento'],
+            'locale': evento['locale'],
+            'luogo': evento['luogo'],
+            'repliche': evento['repliche']
+        }
+        voce = (etag, current_app.json.dumps_bytes(dati) + b'\n')
+        cache.set(evento_id, voce)
+    return con_etag(current_app.response_class(voce[1], mimetype='application/json'), etag)
+
+
+@bp.route('/metrics')
+def metrics():
+    return current_app.response_class(
+        current_app.extensions['metriche'].esporta(), content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
+
+
+@bp.route('/api/password')
+def statistiche_password():
+    return jsonify(current_app.extensions['pool_hash'].statistiche())
+
+
+@bp.route('/api/repliche/<int:evento_id>/stream')
+def stream_repliche(evento_id):
+    # Ogni client collegato occupa un thread del server finché resta aperto
+    flusso = flusso_eventi(
+        current_app.extensions['diffusore'], evento_id, current_app.json.dumps_bytes, SSE_KEEPALIVE
+    )
+    risposta = current_app.response_class(flusso, mimetype='text/event-stream')
+    risposta.headers['Cache-Control'] = 'no-cache'
+    risposta.headers['X-Accel-Buffering'] = 'no'
+    return risposta
+
+
+@bp.route('/api/cache')
+def statistiche_cache():
     return jsonify({
-        'nome_evento': evento.nome_evento,
-        'locale': evento.rel_locale.nome_locale,
-        'luogo': evento.rel_locale.luogo,
-        'repliche': repliche
+        'repliche': current_app.extensions['cache_repliche'].statistiche(),
+        'card': current_app.extensions['cache_card'].statistiche(),
+        'stream': current_app.extensions['diffusore'].statistiche()
     })
 
-@app.route('/repliche/<int:evento_id>')
+@bp.route('/repliche/<int:evento_id>')
 def repliche(evento_id):
     if 'user_id' not in session:
         flash('Per favore, effettua il login per accedere a questa pagina.', 'warning')
-        return redirect(url_for('login', next=request.url))
+        return redirect(url_for('main.login', next=request.url))
     return render_template('repliche.html', evento_id=evento_id)
 
-@app.route('/prenota', methods=['POST'])
+@bp.route('/prenota', methods=['POST'])
 def prenota():
     if 'user_id' not in session:
         flash('Per favore, effettua il login per accedere a questa pagina.', 'warning')
-        return redirect(url_for('login', next=request.url))
-    data = request.json
-    replica_id = data.get('replica_id')
-    quantita = int(data.get('quantita', 1))
-    
-    replica = Replica.query.get_or_404(replica_id)
-    if replica.annullato:
-        return jsonify({'error': 'Questa replica è stata annullata.'}), 400
-    
-    prenotazione = Prenotazione(utente_id=session['user_id'], replica_id=replica_id, quantita=quantita)
-    db.session.add(prenotazione)
-    db.session.commit()
-    return jsonify({'message': 'Prenotazione effettuata con successo!'}), 201
+        return redirect(url_for('main.login', next=request.url))
+    return create_prenotazione(request.json)
 
 
-@app.route('/api/prenotazioni', methods=['GET', 'POST'])
+@bp.route('/api/prenotazioni', methods=['GET', 'POST'])
 def api_prenotazioni():
     if 'user_id' not in session:
         return jsonify({'error': 'Per favore, effettua il login per accedere a questa pagina.'}), 401
@@ -139,17 +293,19 @@ def api_prenotazioni():
     
 
 def get_prenotazioni(): 
-    prenotazioni = Prenotazione.query.filter_by(utente_id=session['user_id']).all()
-    prenotazioni_data = [{
-        'id': p.id,
-        'evento': p.rel_replica.rel_evento.nome_evento,
-        'locale': p.rel_replica.rel_evento.rel_locale.nome_locale,
-        'data_ora': p.rel_replica.data_ora.strftime('%d-%m-%Y %H:%M'),
-        'quantita': p.quantita,
-        'annullato': p.rel_replica.annullato,
-        'replica_id': p.replica_id
-    } for p in prenotazioni]
-    return jsonify(prenotazioni_data)
+    after = request.args.get('after')
+    if after is not None:
+        try:
+            after = leggi_cursore_prenotazione(after)
+        except ValueError:
+            return jsonify({'error': 'Cursore non valido.'}), 400
+    limit = leggi_limit(PRENOTAZIONI_PER_PAGINA)
+    etag = etag_prenotazioni(session['user_id'], request.args.get('after'), limit)
+    if non_modificato(etag):
+        return con_etag(current_app.response_class(status=304), etag, privata=True)
+    righe = prenotazioni_utente(session['user_id'], after=after, limit=limit)
+    risposta = risposta_pagina_json('prenotazioni', righe, limit, serializza_prenotazione.righe, cursore_prenotazione)
+    return con_etag(risposta, etag, privata=True)
 
 
 def handle_prenotazioni_post(data):
@@ -165,31 +321,35 @@ def handle_prenotazioni_post(data):
 
 def create_prenotazione(data):
     replica_id = data.get('replica_id')
-    quantita = data.get('quantita', 1)
-    
-    existing_prenotazione = Prenotazione.query.filter_by(utente_id=session['user_id'], replica_id=replica_id).first()
-    if existing_prenotazione:
+    try:
+        quantita = valida_quantita(data.get('quantita', 1))
+        esito = esegui_prenotazione(crea_prenotazione, session['user_id'], replica_id, quantita)
+    except PrenotazioneRifiutata as errore:
+        db.session.rollback()
+        return jsonify({'error': errore.messaggio}), errore.status
+    except IntegrityError:
+        db.session.rollback()
         return jsonify({'error': 'Hai già una prenotazione per questa replica.'}), 400
-    replica = Replica.query.get_or_404(replica_id)
-    if replica.annullato:
-        return jsonify({'error': 'Questa replica è stata annullata.'}), 400
-    prenotazione = Prenotazione(utente_id=session['user_id'], replica_id=replica_id, quantita=quantita)
-    db.session.add(prenotazione)
-    db.session.commit()
-    return jsonify({'message': 'Prenotazione effettuata con successo!'}), 201
+    return jsonify({'message': 'Prenotazione effettuata con successo!', 'replica': disponibilita(esito)}), 201
 
 def update_prenotazione(data):
     prenotazione_id = data.get('prenotazione_id')
-    nuova_quantita = data.get('quantita')
     prenotazione = Prenotazione.query.get_or_404(prenotazione_id)
     if prenotazione.utente_id != session['user_id']:
         return jsonify({'error': 'Non sei autorizzato a modificare questa prenotazione.'}), 403
     if prenotazione.rel_replica.annullato:
         return jsonify({'error': 'Questa replica è stata annullata.'}), 400
-    
-    prenotazione.quantita = nuova_quantita
-    db.session.commit()
-    return jsonify({'message': 'Prenotazione aggiornata con successo!'})
+    try:
+        quantita = valida_quantita(data.get('quantita'))
+        esito = esegui_prenotazione(modifica_prenotazione, prenotazione.id, quantita)
+    except PrenotazioneRifiutata as errore:
+        db.session.rollback()
+        return jsonify({'error': errore.messaggio}), errore.status
+    return jsonify({
+        'message': 'Prenotazione aggiornata con successo!',
+        'prenotazione': {'id': prenotazione.id, 'quantita': quantita},
+        'replica': disponibilita(esito)
+    })
 
    
 def delete_prenotazione(data):
@@ -199,20 +359,120 @@ def delete_prenotazione(data):
     if prenotazione.utente_id!= session['user_id']:
         return jsonify({'error': 'Non sei autorizzato a cancellare questa prenotazione.'}), 403
     
-    db.session.delete(prenotazione)
-    db.session.commit()
+    try:
+        esito = esegui_prenotazione(cancella_prenotazione, prenotazione.id)
+    except PrenotazioneRifiutata as errore:
+        return jsonify({'error': errore.messaggio}), errore.status
     
-    return jsonify({'message': 'Prenotazione cancellata con successo!'})
+    return jsonify({
+        'message': 'Prenotazione cancellata con successo!',
+        'prenotazione_id': prenotazione.id,
+        'replica': disponibilita(esito)
+    })
+
+
+@bp.cli.command('init-db')
+def init_db_command():
+    try:
+        aggiunte = init_db()
+    except RuntimeError as errore:
+        raise click.ClickException(str(errore))
+    for nome in aggiunte:
+        click.echo(f'Aggiunto: {nome}')
+    click.echo(f'Schema pronto ({len(aggiunte)} modifiche).')
+
+
+@bp.cli.command('seed')
+@click.option('--cartella', type=click.Path(exists=True, file_okay=False), help='Cartella con i file JSON da caricare.')
+def seed_command(cartella):
+    if Utente.query.first() is not None:
+        click.echo('Il database contiene già dei dati: caricamento saltato.')
+        return
+    popola_db(cartella)
+    # I file JSON contengono password in chiaro: si convertono subito in hash
+    converti_password(PASSWORD_PROCESSI_MIGRAZIONE, PASSWORD_BLOCCO_MIGRAZIONE, PASSWORD_METODO_MIGRAZIONE)
+
+
+@bp.cli.command('converti-password')
+@click.option('--processi', default=PASSWORD_PROCESSI_MIGRAZIONE, help='Processi usati per calcolare gli hash.')
+@click.option('--blocco', default=PASSWORD_BLOCCO_MIGRAZIONE, help='Utenti per transazione.')
+@click.option('--metodo', default=PASSWORD_METODO_MIGRAZIONE, help='Metodo di hash per le password convertite.')
+def converti_password_command(processi, blocco, metodo):
+    converti_password(processi, blocco, metodo)
+
+
+def converti_password(processi, blocco, metodo):
+    # Gli hash della migrazione sono più leggeri della politica: vengono aggiornati al primo login
+    inizio = time.perf_counter()
+    totale = 0
+    for convertite in converti_password_in_chiaro(processi, blocco, metodo):
+        totale += convertite
+        click.echo(f'Password convertite: {totale}\r', nl=False)
+    durata = time.perf_counter() - inizio
+    click.echo(f'Convertite {totale} password in {durata:.1f}s ({totale / max(durata, 1e-9):.0f} password/s)')
+
+
+SCRIPT_TEMPO_AVVIO = '''
+import time
+inizio = time.perf_counter()
+import app
+app.create_app()
+print((time.perf_counter() - inizio) * 1000)
+'''
+
+
+@bp.cli.command('tempo-avvio')
+@click.option('--ripetizioni', default=5, help='Numero di misure.')
+def tempo_avvio_command(ripetizioni):
+    # Misura in un processo pulito l'import di app e la creazione dell'applicazione
+    misure = []
+    for _ in range(ripetizioni):
+        risultato = subprocess.run(
+            [sys.executable, '-c', SCRIPT_TEMPO_AVVIO], cwd=BASE_DIR,
+            capture_output=True, text=True, check=True
+        )
+        misure.append(float(risultato.stdout))
+    migliore = min(misure)
+    click.echo(f'Avvio: {migliore:.0f} ms (budget {BUDGET_AVVIO_MS} ms)')
+    if migliore > BUDGET_AVVIO_MS:
+        raise click.ClickException('Budget di avvio superato.')
+
+
+@bp.cli.command('compila-immagini')
+def compila_immagini_command():
+    try:
+        manifest, generate = genera_derivate(current_app.static_folder)
+    except RuntimeError as errore:
+        raise click.ClickException(str(errore))
+    click.echo(f'{len(manifest)} immagini, {generate} rigenerate.')
+
+
+@bp.cli.command('compila-asset')
+def compila_asset_command():
+    # Da eseguire a ogni rilascio, dopo "flask compila-immagini": i worker leggono il manifest all'avvio
+    manifest, scritti = costruisci_asset(current_app.static_folder)
+    click.echo(f'{len(manifest)} asset nel manifest, {scritti} nuovi.')
+
+
+@bp.cli.command('riconcilia-posti')
+def riconcilia_posti_command():
+    derive = riconcilia_posti()
+    for replica_id, contatore, posti_effettivi in derive:
+        click.echo(f'Replica {replica_id}: contatore {contatore}, prenotati {posti_effettivi}')
+    click.echo(f'{len(derive)} repliche riallineate.')
+
+
+bp.cli.add_command(registra_comandi())
 
 
-@app.route('/logout')
+@bp.route('/logout')
 def logout():
     if 'user_id' not in session:
         flash('Per favore, effettua il login per accedere a questa pagina.', 'warning')
-        return redirect(url_for('login', next=request.url))
+        return redirect(url_for('main.login', next=request.url))
     session.clear()
     flash('Logout effettuato con successo.', 'success')
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    create_app().run(debug=True)
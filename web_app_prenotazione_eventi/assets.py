@@ -0,0 +1,103 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+from flask import current_app, request, send_from_directory
+from settings import ASSET_CARTELLA, ASSET_MANIFEST, ASSET_COMPRIMIBILI, ASSET_MAX_AGE
+
+
+def impronta(percorso):
+    sha = hashlib.sha256()
+    with open(percorso, 'rb') as file:
+        for blocco in iter(lambda: file.read(65536), b''):
+            sha.update(blocco)
+    return sha.hexdigest()[:12]
+
+
+def nome_con_impronta(nome, hash_file):
+    base, estensione = os.path.splitext(nome)
+    return f'{base}.{hash_file}{estensione}'
+
+
+def costruisci_asset(cartella_static):
+    # Copia ogni file statico in ASSET_CARTELLA con l'impronta del contenuto nel nome,
+    # aggiunge la variante .gz per i formati testuali e scrive il manifest.
+    # I file già presenti con la stessa impronta non vengono riscritti
+    destinazione = os.path.join(cartella_static, ASSET_CARTELLA)
+    manifest = {}
+    scritti = 0
+    for radice, cartelle, file in os.walk(cartella_static):
+        if os.path.abspath(radice) == os.path.abspath(cartella_static) and ASSET_CARTELLA in cartelle:
+            cartelle.remove(ASSET_CARTELLA)
+        for nome in file:
+            sorgente = os.path.join(radice, nome)
+            relativo = os.path.relpath(sorgente, cartella_static).replace(os.sep, '/')
+            con_impronta = f'{ASSET_CARTELLA}/' + nome_con_impronta(relativo, impronta(sorgente))
+            manifest[relativo] = con_impronta
+            percorso = os.path.join(cartella_static, con_impronta)
+            if os.path.exists(percorso):
+                continue
+            os.makedirs(os.path.dirname(percorso), exist_ok=True)
+            shutil.copyfile(sorgente, percorso)
+            if os.path.splitext(nome)[1].lower() in ASSET_COMPRIMIBILI:
+                with open(sorgente, 'rb') as ingresso, gzip.open(percorso + '.gz', 'wb', compresslevel=9) as uscita:
+                    shutil.copyfileobj(ingresso, uscita)
+            scritti += 1
+
+    # Le versioni precedenti non più nel manifest si eliminano
+    attuali = set(manifest.values())
+    attuali |= {valore + '.gz' for valore in attuali}
+    for radice, _, file in os.walk(destinazione):
+        for nome in file:
+            relativo = os.path.relpath(os.path.join(radice, nome), cartella_static).replace(os.sep, '/')
+            if relativo not in attuali and nome != ASSET_MANIFEST:
+                os.remove(os.path.join(radice, nome))
+
+    with open(os.path.join(destinazione, ASSET_MANIFEST), 'w') as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    return manifest, scritti
+
+
+def carica_manifest(cartella_static):
+    try:
+        with open(os.path.join(cartella_static, ASSET_CARTELLA, ASSET_MANIFEST)) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def configura_asset(app):
+    # Senza "flask compila-asset" il manifest è vuoto e gli URL restano quelli originali
+    app.extensions['asset_manifest'] = carica_manifest(app.static_folder)
+    app.url_defaults(url_asset)
+    app.view_functions['static'] = servi_asset
+
+
+def url_asset(endpoint, values):
+    if endpoint != 'static' or 'filename' not in values:
+        return
+    con_impronta = current_app.extensions['asset_manifest'].get(values['filename'])
+    if con_impronta is not None:
+        values['filename'] = con_impronta
+
+
+def servi_asset(filename):
+    if not filename.startswith(ASSET_CARTELLA + '/'):
+        return current_app.send_static_file(filename)
+
+    # Il nome cambia a ogni modifica del contenuto: il browser può tenerlo per sempre
+    compresso = os.path.join(current_app.static_folder, filename + '.gz')
+    if 'gzip' in request.accept_encodings and os.path.isfile(compresso):
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        risposta = send_from_directory(
+            current_app.static_folder, filename + '.gz', mimetype=mimetype, max_age=ASSET_MAX_AGE
+        )
+        risposta.headers['Content-Encoding'] = 'gzip'
+        risposta.headers.pop('Content-Disposition', None)
+    else:
+        risposta = send_from_directory(current_app.static_folder, filename, max_age=ASSET_MAX_AGE)
+    risposta.vary.add('Accept-Encoding')
+    risposta.cache_control.immutable = True
+    return risposta
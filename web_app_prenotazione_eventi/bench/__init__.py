@@ -0,0 +1,36 @@
+import os
+import tempfile
+from contextlib import contextmanager
+import click
+from settings import DATABASE_PATH
+
+# Benchmark delle ottimizzazioni, da "flask bench <nome>". Ognuno lavora su un database
+# temporaneo creato accanto a quello dell'applicazione (stesso filesystem, stesso costo di fsync)
+bench = click.Group('bench', help='Benchmark riproducibili su database temporanei.')
+
+
+@contextmanager
+def app_temporanea(cartella=None, **config):
+    # I moduli dell'applicazione si importano qui: il gruppo di comandi si registra durante l'import di app
+    from app import create_app
+    from models import db, init_db
+    with tempfile.TemporaryDirectory(dir=cartella or os.path.dirname(DATABASE_PATH)) as temporanea:
+        uri = 'sqlite:///' + os.path.join(temporanea, 'bench.sqlite3')
+        app = create_app({'SQLALCHEMY_DATABASE_URI': uri, **config})
+        with app.app_context():
+            init_db()
+            try:
+                yield app
+            finally:
+                db.session.remove()
+                db.engine.dispose()
+
+
+def registra_comandi():
+    from bench.scritture import group_commit_command
+    from bench.serializzazione import serializzatori_command
+    from bench.json_prenotazioni import json_prenotazioni_command
+    bench.add_command(group_commit_command)
+    bench.add_command(serializzatori_command)
+    bench.add_command(json_prenotazioni_command)
+    return bench
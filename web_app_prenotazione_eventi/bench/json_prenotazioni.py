@@ -0,0 +1,82 @@
+import statistics
+import time
+from datetime import datetime, timedelta
+import click
+from bench import app_temporanea
+
+
+def prepara_prenotazioni(numero):
+    # Un utente con numero prenotazioni, ognuna su una replica diversa
+    from sqlalchemy import insert
+    from models import db, Locale, Evento, Replica, Utente, Prenotazione
+    inizio = datetime(2030, 1, 1, 21, 0)
+    db.session.execute(insert(Locale), [{'id': 1, 'nome_locale': 'Teatro Verdi', 'luogo': 'Firenze', 'posti': 1000}])
+    db.session.execute(insert(Evento), [
+        {'id': indice, 'locale_id': 1, 'nome_evento': f'Concerto numero {indice}'} for indice in range(1, 101)
+    ])
+    db.session.execute(insert(Replica), [
+        {'id': indice, 'evento_id': indice % 100 + 1, 'data_ora': inizio + timedelta(hours=indice), 'posti_prenotati': 2}
+        for indice in range(1, numero + 1)
+    ])
+    db.session.execute(insert(Utente), [
+        {'id': 1, 'nome': 'Bench', 'cognome': 'Bench', 'email': 'bench@example.com', 'password': '-'}
+    ])
+    db.session.execute(insert(Prenotazione), [
+        {'utente_id': 1, 'replica_id': indice, 'quantita': 2} for indice in range(1, numero + 1)
+    ])
+    db.session.commit()
+
+
+def millisecondi(funzione, ripetizioni):
+    # Una esecuzione a vuoto per riempire cache di SQLite e statement compilati
+    funzione()
+    misure = []
+    for _ in range(ripetizioni):
+        inizio = time.perf_counter()
+        funzione()
+        misure.append((time.perf_counter() - inizio) * 1000)
+    return statistics.median(misure)
+
+
+@click.command('json-prenotazioni')
+@click.option('--righe', default=10000, help='Prenotazioni nella risposta.')
+@click.option('--ripetizioni', default=20, help='Misure per variante (si riporta la mediana).')
+def json_prenotazioni_command(righe, ripetizioni):
+    # Corpo di /api/prenotazioni con tutte le prenotazioni in una pagina, query compresa: lista di dict
+    # codificata da jsonify() contro righe codificate a blocchi da risposta_pagina_json().
+    # La rotta limita le pagine a LIMITE_MASSIMO_PAGINA righe: qui si chiamano direttamente le funzioni
+    import json_provider
+    from flask.json.provider import DefaultJSONProvider
+    from queries import prenotazioni_utente, serializza_prenotazione, cursore_prenotazione
+
+    def lista(provider):
+        dati = serializza_prenotazione.righe(prenotazioni_utente(1, limit=righe))
+        # Si scarta la riga in più che serve a calcolare next
+        return provider.response({'prenotazioni': dati[:righe], 'next': None}).get_data()
+
+    def flusso():
+        risposta = json_provider.risposta_pagina_json(
+            'prenotazioni', prenotazioni_utente(1, limit=righe), righe,
+            serializza_prenotazione.righe, cursore_prenotazione
+        )
+        return risposta.get_data()
+
+    with app_temporanea() as app:
+        prepara_prenotazioni(righe)
+        with app.test_request_context():
+            veloce = app.json
+            # Riferimento: query e serializzazione senza codifica
+            senza_codifica = millisecondi(lambda: serializza_prenotazione.righe(prenotazioni_utente(1, limit=righe)), ripetizioni)
+            click.echo(f'solo query e dict            {senza_codifica:7.1f} ms')
+            if json_provider.orjson is not None:
+                click.echo(f'jsonify, orjson              {millisecondi(lambda: lista(veloce), ripetizioni):7.1f} ms')
+                click.echo(f'a flusso, orjson             {millisecondi(flusso, ripetizioni):7.1f} ms')
+            else:
+                click.echo('orjson non installato: solo le varianti con la libreria standard')
+            orjson = json_provider.orjson
+            json_provider.orjson = None
+            try:
+                click.echo(f'jsonify, provider di Flask   {millisecondi(lambda: lista(DefaultJSONProvider(app)), ripetizioni):7.1f} ms')
+                click.echo(f'a flusso, libreria standard  {millisecondi(flusso, ripetizioni):7.1f} ms')
+            finally:
+                json_provider.orjson = orjson
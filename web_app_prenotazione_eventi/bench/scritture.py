@@ -0,0 +1,82 @@
+import threading
+import time
+from datetime import datetime
+import click
+from bench import app_temporanea
+
+
+def prepara_dati(utenti, repliche):
+    from sqlalchemy import insert
+    from models import db, Locale, Evento, Replica, Utente
+    # Capienza illimitata di fatto: si misura il costo dei commit, non i rifiuti per posti esauriti
+    db.session.execute(insert(Locale), [{'id': 1, 'nome_locale': 'Bench', 'luogo': 'Bench', 'posti': 10 ** 9}])
+    db.session.execute(insert(Evento), [{'id': 1, 'locale_id': 1, 'nome_evento': 'Bench'}])
+    db.session.execute(insert(Replica), [
+        {'id': indice, 'evento_id': 1, 'data_ora': datetime(2030, 1, 1 + indice % 28, 21)}
+        for indice in range(1, repliche + 1)
+    ])
+    db.session.execute(insert(Utente), [
+        {'id': indice, 'nome': 'Bench', 'cognome': 'Bench', 'email': f'bench{indice}@example.com', 'password': '-'}
+        for indice in range(1, utenti + 1)
+    ])
+    db.session.commit()
+
+
+def misura_prenotazioni(app, thread, per_thread, repliche):
+    # Ogni thread simula una richiesta alla volta: una prenotazione, poi la sessione si chiude
+    from models import db
+    from group_commit import esegui_scrittura
+    from seats import crea_prenotazione
+    errori = []
+
+    def lavora(numero):
+        with app.app_context():
+            for indice in range(per_thread):
+                try:
+                    esegui_scrittura(crea_prenotazione, numero * per_thread + indice + 1, indice % repliche + 1, 1)
+                except Exception as errore:
+                    errori.append(errore)
+                finally:
+                    db.session.remove()
+
+    lavoratori = [threading.Thread(target=lavora, args=(numero,)) for numero in range(thread)]
+    inizio = time.perf_counter()
+    for lavoratore in lavoratori:
+        lavoratore.start()
+    for lavoratore in lavoratori:
+        lavoratore.join()
+    durata = time.perf_counter() - inizio
+    if errori:
+        raise click.ClickException(f'{len(errori)} prenotazioni fallite, per esempio: {errori[0]!r}')
+    return thread * per_thread / durata
+
+
+@click.command('group-commit')
+@click.option('--thread', default=32, help='Richieste concorrenti.')
+@click.option('--prenotazioni', default=40, help='Prenotazioni per thread.')
+@click.option('--repliche', default=5, help='Repliche su cui si distribuiscono le prenotazioni.')
+@click.option('--synchronous', 'modalita', multiple=True, default=('FULL', 'NORMAL'), help='PRAGMA synchronous da provare.')
+@click.option('--cartella', type=click.Path(exists=True, file_okay=False), help='Cartella del database temporaneo.')
+def group_commit_command(thread, prenotazioni, repliche, modalita, cartella):
+    # Prenotazioni al secondo con un commit per richiesta e con lo scrittore di gruppo
+    from settings import SQLITE_PRAGMAS
+    from group_commit import avvia_group_commit
+    originale = SQLITE_PRAGMAS['synchronous']
+    try:
+        for synchronous in modalita:
+            # I pragma si leggono a ogni nuova connessione: vale per l'engine creato da app_temporanea
+            SQLITE_PRAGMAS['synchronous'] = synchronous
+            risultati = {}
+            for scrittura in ('richiesta', 'gruppo'):
+                with app_temporanea(cartella) as app:
+                    app.extensions.pop('scrittore_di_gruppo', None)
+                    if scrittura == 'gruppo':
+                        avvia_group_commit(app)
+                    prepara_dati(thread * prenotazioni, repliche)
+                    risultati[scrittura] = misura_prenotazioni(app, thread, prenotazioni, repliche)
+            click.echo(
+                f"synchronous={synchronous:<7} commit per richiesta {risultati['richiesta']:7.0f}/s   "
+                f"group commit {risultati['gruppo']:7.0f}/s   ({risultati['gruppo'] / risultati['richiesta']:.2f}x)"
+            )
+    finally:
+        SQLITE_PRAGMAS['synchronous'] = originale
@@ -0,0 +1,67 @@
+import time
+from datetime import datetime
+import click
+
+
+def replica_serializer_mixin():
+    # Stesse colonne di Replica su una base separata, con il SerializerMixin usato prima dei serializzatori.
+    # None se sqlalchemy_serializer non è installato
+    try:
+        from sqlalchemy_serializer import SerializerMixin
+    except ImportError:
+        return None
+    from sqlalchemy import Boolean, Column, DateTime, Integer
+    from sqlalchemy.orm import declarative_base
+    Base = declarative_base()
+
+    class ReplicaSerializerMixin(Base, SerializerMixin):
+        __tablename__ = 'repliche'
+        datetime_format = '%d-%m-%Y %H:%M'
+        id = Column(Integer, primary_key=True)
+        evento_id = Column(Integer, nullable=False)
+        data_ora = Column(DateTime, nullable=False)
+        annullato = Column(Boolean, default=False)
+        posti_prenotati = Column(Integer, nullable=False, default=0)
+        versione = Column(Integer, nullable=False, default=0)
+
+    return ReplicaSerializerMixin
+
+
+def valori_replica(indice):
+    return {
+        'id': indice, 'evento_id': indice % 50, 'data_ora': datetime(2030, 7, 1 + indice % 30, 20, 30),
+        'annullato': False, 'posti_prenotati': 3, 'versione': 0
+    }
+
+
+def cronometra(funzione):
+    from serializers import formatta_data_ora
+    formatta_data_ora.cache_clear()
+    inizio = time.perf_counter()
+    funzione()
+    return time.perf_counter() - inizio
+
+
+@click.command('serializzatori')
+@click.option('--righe', default=100000, help='Repliche serializzate per misura.')
+def serializzatori_command(righe):
+    # Stesse repliche serializzate con SerializerMixin.to_dict(), con SerializzatoreMixin.to_dict()
+    # sugli oggetti e con Serializzatore.righe() sulle tuple restituite dalle query
+    from models import Replica
+    from queries import serializza_replica
+    modello = replica_serializer_mixin()
+    if modello is None:
+        click.echo('SerializerMixin.to_dict()        saltato: sqlalchemy_serializer non installato')
+    else:
+        oggetti = [modello(**valori_replica(indice)) for indice in range(righe)]
+        durata = cronometra(lambda: [oggetto.to_dict() for oggetto in oggetti])
+        click.echo(f'SerializerMixin.to_dict()        {durata:8.3f} s')
+    oggetti = [Replica(**valori_replica(indice)) for indice in range(righe)]
+    durata = cronometra(lambda: [oggetto.to_dict() for oggetto in oggetti])
+    click.echo(f'SerializzatoreMixin.to_dict()    {durata:8.3f} s')
+    tuple_righe = [
+        (valori['id'], valori['data_ora'], valori['annullato'], 147)
+        for valori in map(valori_replica, range(righe))
+    ]
+    durata = cronometra(lambda: serializza_replica.righe(tuple_righe))
+    click.echo(f'Serializzatore.righe() su tuple  {durata:8.3f} s')
@@ -0,0 +1,64 @@
+import queue
+import threading
+
+
+class Diffusore:
+    # Smista gli aggiornamenti di un evento a tutti i client collegati al suo stream:
+    # una sola pubblicazione per scrittura, nessun polling del database per client
+    def __init__(self, coda_massima):
+        self.coda_massima = coda_massima
+        self.iscritti = {}
+        self.lock = threading.Lock()
+
+    def iscrivi(self, chiave):
+        coda = queue.Queue(self.coda_massima)
+        with self.lock:
+            self.iscritti.setdefault(chiave, set()).add(coda)
+        return coda
+
+    def disiscrivi(self, chiave, coda):
+        with self.lock:
+            code = self.iscritti.get(chiave)
+            if code is None:
+                return
+            code.discard(coda)
+            if not code:
+                del self.iscritti[chiave]
+
+    def pubblica(self, chiave, messaggio):
+        with self.lock:
+            code = list(self.iscritti.get(chiave, ()))
+        for coda in code:
+            try:
+                coda.put_nowait(messaggio)
+            except queue.Full:
+                # Client troppo lento: si scarta il messaggio più vecchio, conta solo lo stato più recente
+                try:
+                    coda.get_nowait()
+                except queue.Empty:
+                    pass
+                try:
+                    coda.put_nowait(messaggio)
+                except queue.Full:
+                    pass
+
+    def statistiche(self):
+        with self.lock:
+            return {'eventi': len(self.iscritti), 'client': sum(len(code) for code in self.iscritti.values())}
+
+
+def flusso_eventi(diffusore, chiave, codifica, intervallo_keepalive):
+    # Formato text/event-stream: un evento "posti" per aggiornamento, un commento come keepalive.
+    # L'iscrizione avviene alla prima lettura, così la chiusura del generatore la rimuove sempre
+    coda = diffusore.iscrivi(chiave)
+    try:
+        yield b'retry: 3000\n\n'
+        while True:
+            try:
+                messaggio = coda.get(timeout=intervallo_keepalive)
+            except queue.Empty:
+                yield b': keepalive\n\n'
+                continue
+            yield b'event: posti\ndata: ' + codifica(messaggio) + b'\n\n'
+    finally:
+        diffusore.disiscrivi(chiave, coda)
@@ -0,0 +1,45 @@
+import threading
+from collections import OrderedDict
+
+
+class CacheLRU:
+    # Cache in memoria del processo, thread-safe, con espulsione del meno usato di recente
+    def __init__(self, capienza):
+        self.capienza = capienza
+        self.voci = OrderedDict()
+        self.lock = threading.Lock()
+        self.hit = 0
+        self.miss = 0
+        self.espulsioni = 0
+
+    def get(self, chiave):
+        with self.lock:
+            valore = self.voci.get(chiave)
+            if valore is None:
+                self.miss += 1
+                return None
+            self.voci.move_to_end(chiave)
+            self.hit += 1
+            return valore
+
+    def set(self, chiave, valore):
+        with self.lock:
+            self.voci[chiave] = valore
+            self.voci.move_to_end(chiave)
+            while len(self.voci) > self.capienza:
+                self.voci.popitem(last=False)
+                self.espulsioni += 1
+
+    def invalida(self, chiave):
+        with self.lock:
+            self.voci.pop(chiave, None)
+
+    def statistiche(self):
+        with self.lock:
+            return {
+                'voci': len(self.voci),
+                'capienza': self.capienza,
+                'hit': self.hit,
+                'miss': self.miss,
+                'espulsioni': self.espulsioni
+            }
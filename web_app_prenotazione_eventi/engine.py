@@ -0,0 +1,46 @@
+import random
+import sqlite3
+import time
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from models import db
+from settings import SQLITE_PRAGMAS, SQLITE_TENTATIVI_COMMIT, SQLITE_ATTESA_BASE, SQLITE_ATTESA_MASSIMA
+
+
+def imposta_pragma(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursore = dbapi_connection.cursor()
+    for nome, valore in SQLITE_PRAGMAS.items():
+        cursore.execute(f'PRAGMA {nome} = {valore}')
+    cursore.close()
+
+
+def configura_sqlite():
+    # Va chiamata prima di init_db, così anche le prime connessioni del pool ricevono i pragma
+    if not event.contains(Engine, 'connect', imposta_pragma):
+        event.listen(Engine, 'connect', imposta_pragma)
+
+
+def database_bloccato(errore):
+    return isinstance(errore.orig, sqlite3.OperationalError) and 'locked' in str(errore.orig)
+
+
+def attendi_jitter(tentativo):
+    time.sleep(random.uniform(0, min(SQLITE_ATTESA_MASSIMA, SQLITE_ATTESA_BASE * 2 ** tentativo)))
+
+
+def esegui_transazione(operazione, *args):
+    # Esegue operazione + commit; se SQLite è bloccato ripete l'intera transazione
+    # con un'attesa casuale (jitter) limitata da SQLITE_ATTESA_MASSIMA
+    for tentativo in range(SQLITE_TENTATIVI_COMMIT):
+        try:
+            risultato = operazione(*args)
+            db.session.commit()
+            return risultato
+        except OperationalError as errore:
+            db.session.rollback()
+            if not database_bloccato(errore) or tentativo == SQLITE_TENTATIVI_COMMIT - 1:
+                raise
+            attendi_jitter(tentativo)
@@ -0,0 +1,121 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+from flask import current_app
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from engine import attendi_jitter, database_bloccato, esegui_transazione
+from models import db
+from settings import GROUP_COMMIT_FINESTRA, GROUP_COMMIT_LOTTO_MASSIMO, GROUP_COMMIT_TIMEOUT, SQLITE_TENTATIVI_COMMIT
+
+
+class ScritturaScaduta(Exception):
+    pass
+
+
+class ScrittoreDiGruppo:
+    # Un solo thread scrive: le operazioni arrivate entro la finestra finiscono in
+    # un'unica transazione (un solo fsync), ognuna isolata in un SAVEPOINT
+    def __init__(self, app, finestra=GROUP_COMMIT_FINESTRA, lotto_massimo=GROUP_COMMIT_LOTTO_MASSIMO,
+                 timeout=GROUP_COMMIT_TIMEOUT):
+        self.app = app
+        self.finestra = finestra
+        self.lotto_massimo = lotto_massimo
+        self.timeout = timeout
+        self.coda = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def esegui(self, operazione, *args):
+        self.avvia()
+        futuro = Future()
+        self.coda.put((operazione, args, futuro))
+        try:
+            return futuro.result(timeout=self.timeout)
+        except TimeoutError:
+            # Ancora in coda: si ritira e lo scrittore la salta. Già nel lotto in corso:
+            # l'esito arriva con il commit, ma comunque entro un'altra attesa limitata
+            if futuro.cancel():
+                raise ScritturaScaduta()
+        try:
+            return futuro.result(timeout=self.timeout)
+        except TimeoutError:
+            raise ScritturaScaduta()
+
+    def avvia(self):
+        # Avvio pigro: nessun thread nei processi che non scrivono (o prima di un fork)
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.ciclo, name='scrittore-di-gruppo', daemon=True)
+                self.thread.start()
+
+    def ciclo(self):
+        while True:
+            # Le operazioni ritirate dal chiamante per timeout non si eseguono
+            lotto = [voce for voce in self.raccogli() if voce[2].set_running_or_notify_cancel()]
+            if not lotto:
+                continue
+            try:
+                with self.app.app_context():
+                    self.scrivi(lotto)
+            except Exception as errore:
+                # Qualunque errore imprevisto chiude il lotto senza fermare il thread:
+                # nessun chiamante resta in attesa di un esito che non arriverebbe
+                for _, _, futuro in lotto:
+                    if not futuro.done():
+                        futuro.set_exception(errore)
+
+    def raccogli(self):
+        lotto = [self.coda.get()]
+        scadenza = time.monotonic() + self.finestra
+        while len(lotto) < self.lotto_massimo:
+            resto = scadenza - time.monotonic()
+            if resto <= 0:
+                break
+            try:
+                lotto.append(self.coda.get(timeout=resto))
+            except queue.Empty:
+                break
+        return lotto
+
+    def scrivi(self, lotto):
+        for tentativo in range(SQLITE_TENTATIVI_COMMIT):
+            esiti = []
+            try:
+                # BEGIN esplicito: i SAVEPOINT devono stare dentro una transazione già aperta
+                db.session.execute(text('BEGIN IMMEDIATE'))
+                for operazione, args, futuro in lotto:
+                    try:
+                        with db.session.begin_nested():
+                            risultato = operazione(*args)
+                    except OperationalError:
+                        raise
+                    except Exception as errore:
+                        esiti.append((futuro, None, errore))
+                    else:
+                        esiti.append((futuro, risultato, None))
+                db.session.commit()
+                break
+            except OperationalError as errore:
+                db.session.rollback()
+                if not database_bloccato(errore) or tentativo == SQLITE_TENTATIVI_COMMIT - 1:
+                    esiti = [(futuro, None, errore) for _, _, futuro in lotto]
+                    break
+                attendi_jitter(tentativo)
+        for futuro, risultato, errore in esiti:
+            if errore is not None:
+                futuro.set_exception(errore)
+            else:
+                futuro.set_result(risultato)
+
+
+def avvia_group_commit(app):
+    app.extensions['scrittore_di_gruppo'] = ScrittoreDiGruppo(app)
+
+
+def esegui_scrittura(operazione, *args):
+    scrittore = current_app.extensions.get('scrittore_di_gruppo')
+    if scrittore is None:
+        return esegui_transazione(operazione, *args)
+    return scrittore.esegui(operazione, *args)
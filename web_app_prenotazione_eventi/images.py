@@ -0,0 +1,90 @@
+import json
+import os
+from flask import current_app, url_for
+from assets import impronta
+from settings import IMMAGINI_SORGENTI, IMMAGINI_CARTELLA, IMMAGINI_MANIFEST, IMMAGINI_LARGHEZZE, IMMAGINI_QUALITA
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+ESTENSIONI_SORGENTE = ('.jpg', '.jpeg', '.png')
+
+
+def genera_derivate(cartella_static):
+    # Per ogni immagine in IMMAGINI_SORGENTI genera le larghezze minori dell'originale,
+    # nel formato originale e in WebP. Un'immagine si rigenera solo se cambiano il suo contenuto o i parametri
+    if Image is None:
+        raise RuntimeError('Pillow non è installato.')
+    destinazione = os.path.join(cartella_static, IMMAGINI_CARTELLA)
+    os.makedirs(destinazione, exist_ok=True)
+    precedente = carica_derivate(cartella_static)
+    # Le derivate si riusano solo se generate con le stesse larghezze e la stessa qualità
+    parametri = {'larghezze': list(IMMAGINI_LARGHEZZE), 'qualita': IMMAGINI_QUALITA}
+    manifest = {}
+    generate = 0
+    for nome in sorted(os.listdir(os.path.join(cartella_static, IMMAGINI_SORGENTI))):
+        base, estensione = os.path.splitext(nome)
+        if estensione.lower() not in ESTENSIONI_SORGENTE:
+            continue
+        relativo = f'{IMMAGINI_SORGENTI}/{nome}'
+        sorgente = os.path.join(cartella_static, relativo)
+        hash_file = impronta(sorgente)
+        voce = precedente.get(relativo)
+        if voce is not None and voce['impronta'] == hash_file and voce.get('parametri') == parametri and all(
+            os.path.exists(os.path.join(cartella_static, file))
+            for varianti in (voce['originale'], voce['webp']) for _, file in varianti
+        ):
+            manifest[relativo] = voce
+            continue
+
+        with Image.open(sorgente) as immagine:
+            formato = immagine.format
+            larghezza_originale, altezza_originale = immagine.size
+            voce = {'impronta': hash_file, 'parametri': parametri, 'originale': [], 'webp': []}
+            for larghezza in [l for l in IMMAGINI_LARGHEZZE if l < larghezza_originale] + [larghezza_originale]:
+                altezza = round(altezza_originale * larghezza / larghezza_originale)
+                ridotta = immagine if larghezza == larghezza_originale else immagine.resize((larghezza, altezza), Image.LANCZOS)
+                if larghezza == larghezza_originale:
+                    voce['originale'].append((larghezza, relativo))
+                else:
+                    file = f'{IMMAGINI_CARTELLA}/{base}-{larghezza}{estensione}'
+                    ridotta.save(os.path.join(cartella_static, file), formato, quality=IMMAGINI_QUALITA, optimize=True)
+                    voce['originale'].append((larghezza, file))
+                file = f'{IMMAGINI_CARTELLA}/{base}-{larghezza}.webp'
+                ridotta.save(os.path.join(cartella_static, file), 'WEBP', quality=IMMAGINI_QUALITA, method=6)
+                voce['webp'].append((larghezza, file))
+        manifest[relativo] = voce
+        generate += 1
+
+    # Si eliminano le derivate di immagini rimosse e quelle di larghezze non più previste
+    attuali = {file for voce in manifest.values() for varianti in (voce['originale'], voce['webp']) for _, file in varianti}
+    for nome in os.listdir(destinazione):
+        if nome != IMMAGINI_MANIFEST and f'{IMMAGINI_CARTELLA}/{nome}' not in attuali:
+            os.remove(os.path.join(destinazione, nome))
+
+    with open(os.path.join(destinazione, IMMAGINI_MANIFEST), 'w') as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    return manifest, generate
+
+
+def carica_derivate(cartella_static):
+    try:
+        with open(os.path.join(cartella_static, IMMAGINI_CARTELLA, IMMAGINI_MANIFEST)) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def configura_immagini(app):
+    # Senza "flask compila-immagini" srcset_immagine restituisce una stringa vuota
+    app.extensions['immagini_derivate'] = carica_derivate(app.static_folder)
+    app.add_template_global(srcset_immagine)
+
+
+def srcset_immagine(percorso, formato='originale'):
+    voce = current_app.extensions['immagini_derivate'].get(percorso)
+    if voce is None:
+        return ''
+    return ', '.join(f"{url_for('static', filename=file)} {larghezza}w" for larghezza, file in voce[formato])
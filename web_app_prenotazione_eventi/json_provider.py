@@ -0,0 +1,80 @@
+import json
+from itertools import islice
+from flask import current_app, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class JSONProviderVeloce(DefaultJSONProvider):
+    # Usa orjson se installato, altrimenti il modulo json della libreria standard
+    def opzioni_orjson(self):
+        opzioni = orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            opzioni |= orjson.OPT_SORT_KEYS
+        return opzioni
+
+    def dumps_bytes(self, obj):
+        if orjson is None:
+            return self.dumps_bytes_stdlib(obj)
+        try:
+            return orjson.dumps(obj, default=self.default, option=self.opzioni_orjson())
+        except TypeError:
+            # orjson rifiuta ciò che json accetta (per esempio chiavi intere): si riprova con la
+            # libreria standard, così il risultato non dipende dal pacchetto installato
+            return self.dumps_bytes_stdlib(obj)
+
+    def dumps_bytes_stdlib(self, obj):
+        return json.dumps(
+            obj, default=self.default, ensure_ascii=self.ensure_ascii,
+            sort_keys=self.sort_keys, separators=(',', ':')
+        ).encode()
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return self.dumps_bytes(obj).decode()
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # In debug si mantiene l'output indentato di Flask
+        if self._app.debug:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj) + b'\n', mimetype=self.mimetype)
+
+
+def risposta_pagina_json(chiave, righe, limit, serializza, cursore, blocco=256):
+    # Serializza e codifica le righe a blocchi mentre arrivano dal cursore, senza costruire la pagina intera.
+    # Le righe sono limit + 1: l'ultima serve solo a sapere se esiste la pagina successiva, il cui
+    # cursore si ricava dall'ultima riga inviata
+    provider = current_app.json
+    righe = iter(righe)
+
+    def genera():
+        yield b'{"' + chiave.encode() + b'":['
+        separatore = b''
+        prossimo = None
+        inviate = 0
+        while inviate < limit:
+            gruppo = list(islice(righe, min(blocco, limit - inviate)))
+            if not gruppo:
+                break
+            # Un blocco è una lista JSON: basta togliere le parentesi quadre esterne
+            yield separatore + provider.dumps_bytes(serializza(gruppo))[1:-1]
+            separatore = b','
+            inviate += len(gruppo)
+            ultima = gruppo[-1]
+        else:
+            if next(righe, None) is not None:
+                prossimo = cursore(ultima)
+        yield b'],"next":' + provider.dumps_bytes(prossimo) + b'}\n'
+
+    return current_app.response_class(stream_with_context(genera()), mimetype=provider.mimetype)
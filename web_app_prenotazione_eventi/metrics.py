@@ -0,0 +1,141 @@
+import threading
+import time
+from bisect import bisect_left
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from settings import METRICHE_BUCKET_LATENZA
+
+# Stato della richiesta in corso nel thread: lo aggiornano gli eventi del motore SQL
+richiesta_corrente = threading.local()
+
+
+def prima_della_query(conn, cursor, statement, parameters, context, executemany):
+    richiesta_corrente.inizio_query = time.perf_counter()
+
+
+def dopo_la_query(conn, cursor, statement, parameters, context, executemany):
+    if getattr(richiesta_corrente, 'attiva', False):
+        richiesta_corrente.query += 1
+        richiesta_corrente.tempo_sql += time.perf_counter() - richiesta_corrente.inizio_query
+
+
+class Metriche:
+    # Contatori per rotta aggiornati una volta per richiesta, sotto un solo lock
+    def __init__(self, bucket):
+        self.bucket = tuple(bucket)
+        self.lock = threading.Lock()
+        self.richieste = {}
+        self.latenze = {}
+        self.in_corso = {}
+        self.query = {}
+        self.tempo_sql = {}
+
+    def inizio(self, rotta):
+        with self.lock:
+            self.in_corso[rotta] = self.in_corso.get(rotta, 0) + 1
+
+    def fine(self, rotta, metodo, stato, durata, query, tempo_sql):
+        chiave = (rotta, metodo)
+        with self.lock:
+            self.in_corso[rotta] -= 1
+            self.richieste[(rotta, metodo, stato)] = self.richieste.get((rotta, metodo, stato), 0) + 1
+            istogramma = self.latenze.get(chiave)
+            if istogramma is None:
+                # Conteggi per bucket (l'ultimo è +Inf), somma e numero di osservazioni
+                istogramma = self.latenze[chiave] = [[0] * (len(self.bucket) + 1), 0.0, 0]
+            istogramma[0][bisect_left(self.bucket, durata)] += 1
+            istogramma[1] += durata
+            istogramma[2] += 1
+            self.query[chiave] = self.query.get(chiave, 0) + query
+            self.tempo_sql[chiave] = self.tempo_sql.get(chiave, 0.0) + tempo_sql
+
+    def esporta(self):
+        # Formato di esposizione testuale di Prometheus (versione 0.0.4)
+        with self.lock:
+            richieste = dict(self.richieste)
+            latenze = {chiave: (list(valore[0]), valore[1], valore[2]) for chiave, valore in self.latenze.items()}
+            in_corso = dict(self.in_corso)
+            query = dict(self.query)
+            tempo_sql = dict(self.tempo_sql)
+        righe = [
+            '# HELP http_requests_total Richieste servite per rotta, metodo e stato.',
+            '# TYPE http_requests_total counter'
+        ]
+        for (rotta, metodo, stato), valore in sorted(richieste.items()):
+            righe.append(f'http_requests_total{{{etichette(route=rotta, method=metodo, status=stato)}}} {valore}')
+        righe += [
+            '# HELP http_request_duration_seconds Durata delle richieste per rotta e metodo.',
+            '# TYPE http_request_duration_seconds histogram'
+        ]
+        for (rotta, metodo), (conteggi, somma, numero) in sorted(latenze.items()):
+            cumulato = 0
+            for limite, conteggio in zip(self.bucket + ('+Inf',), conteggi):
+                cumulato += conteggio
+                righe.append(
+                    f'http_request_duration_seconds_bucket{{{etichette(route=rotta, method=metodo, le=limite)}}} {cumulato}'
+                )
+            righe.append(f'http_request_duration_seconds_sum{{{etichette(route=rotta, method=metodo)}}} {somma}')
+            righe.append(f'http_request_duration_seconds_count{{{etichette(route=rotta, method=metodo)}}} {numero}')
+        righe += [
+            '# HELP http_requests_in_flight Richieste in corso per rotta.',
+            '# TYPE http_requests_in_flight gauge'
+        ]
+        for rotta, valore in sorted(in_corso.items()):
+            righe.append(f'http_requests_in_flight{{{etichette(route=rotta)}}} {valore}')
+        righe += [
+            '# HELP db_queries_total Query SQL eseguite per rotta e metodo.',
+            '# TYPE db_queries_total counter'
+        ]
+        for (rotta, metodo), valore in sorted(query.items()):
+            righe.append(f'db_queries_total{{{etichette(route=rotta, method=metodo)}}} {valore}')
+        righe += [
+            '# HELP db_query_duration_seconds_total Tempo passato nelle query SQL per rotta e metodo.',
+            '# TYPE db_query_duration_seconds_total counter'
+        ]
+        for (rotta, metodo), valore in sorted(tempo_sql.items()):
+            righe.append(f'db_query_duration_seconds_total{{{etichette(route=rotta, method=metodo)}}} {valore}')
+        return '\n'.join(righe) + '\n'
+
+
+def etichette(**valori):
+    return ','.join(
+        f'{nome}="' + str(valore).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for nome, valore in valori.items()
+    )
+
+
+def configura_metriche(app):
+    # La rotta è la regola di URL (per esempio /api/repliche/<int:evento_id>), non il percorso:
+    # il numero di serie resta limitato. Le richieste senza regola finiscono sotto "nessuna"
+    metriche = app.extensions['metriche'] = Metriche(METRICHE_BUCKET_LATENZA)
+    if not event.contains(Engine, 'after_cursor_execute', dopo_la_query):
+        event.listen(Engine, 'before_cursor_execute', prima_della_query)
+        event.listen(Engine, 'after_cursor_execute', dopo_la_query)
+
+    @app.before_request
+    def inizio_richiesta():
+        richiesta_corrente.attiva = True
+        richiesta_corrente.inizio = time.perf_counter()
+        richiesta_corrente.query = 0
+        richiesta_corrente.tempo_sql = 0.0
+        richiesta_corrente.stato = 500
+        richiesta_corrente.rotta = request.url_rule.rule if request.url_rule is not None else 'nessuna'
+        metriche.inizio(richiesta_corrente.rotta)
+
+    @app.after_request
+    def stato_richiesta(risposta):
+        richiesta_corrente.stato = risposta.status_code
+        return risposta
+
+    # teardown: arriva anche dopo le risposte in streaming che mantengono il contesto
+    @app.teardown_request
+    def fine_richiesta(errore):
+        if not getattr(richiesta_corrente, 'attiva', False):
+            return
+        richiesta_corrente.attiva = False
+        metriche.fine(
+            richiesta_corrente.rotta, request.method, richiesta_corrente.stato,
+            time.perf_counter() - richiesta_corrente.inizio,
+            richiesta_corrente.query, richiesta_corrente.tempo_sql
+        )
@@ -1,15 +1,17 @@
 
 import os
-from settings import BASE_DIR
+from settings import BASE_DIR, SEED_DIMENSIONE_BLOCCO
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy_serializer import SerializerMixin
+from sqlalchemy import func, insert, inspect, text
+from serializers import SerializzatoreMixin
 from datetime import datetime
 import json
+import time
 
 db = SQLAlchemy()
 
 
-class Locale(db.Model, SerializerMixin):
+class Locale(db.Model, SerializzatoreMixin):
     __tablename__ = 'locali'
     id = db.Column(db.Integer, primary_key=True)  
     nome_locale = db.Column(db.String(50), nullable=False)  
@@ -18,10 +20,9 @@ class Locale(db.Model, SerializerMixin):
    
     #
     rel_eventi = db.relationship('Evento', back_populates='rel_locale', lazy=True)
-    serialize_rules = ('-rel_eventi.rel_locale',)
 
 
-class Evento(db.Model, SerializerMixin):
+class Evento(db.Model, SerializzatoreMixin):
     __tablename__ = 'eventi'
     id = db.Column(db.Integer, primary_key=True)  
     locale_id = db.Column(db.Integer, db.ForeignKey('locali.id'), nullable=False) 
@@ -30,22 +31,26 @@ class Evento(db.Model, SerializerMixin):
 
     rel_locale = db.relationship('Locale', back_populates='rel_eventi', lazy=True)
     rel_repliche = db.relationship('Replica', back_populates='rel_evento', lazy=True)
-    serialize_rules = ('-rel_locale.rel_eventi', '-rel_repliche.rel_evento')
 
 
-class Replica(db.Model, SerializerMixin):
+class Replica(db.Model, SerializzatoreMixin):
     __tablename__ = 'repliche'
     id = db.Column(db.Integer, primary_key=True) 
     evento_id = db.Column(db.Integer, db.ForeignKey('eventi.id'), nullable=False)  
     data_ora = db.Column(db.DateTime, nullable=False) 
     annullato = db.Column(db.Boolean, default=False)  
+    posti_prenotati = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    versione = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     rel_evento = db.relationship('Evento', back_populates='rel_repliche', lazy=True)
     rel_prenotazioni = db.relationship('Prenotazione', back_populates='rel_replica', lazy=True)
-    serialize_rules = ('-rel_evento.rel_repliche', '-rel_prenotazioni.rel_replica')
 
+    __table_args__ = (
+        db.Index('ix_repliche_evento_data_ora', 'evento_id', 'data_ora'),
+    )
 
-class Utente(db.Model, SerializerMixin):
+
+class Utente(db.Model, SerializzatoreMixin):
     __tablename__ = 'utenti'
     id = db.Column(db.Integer, primary_key=True) 
     cognome = db.Column(db.String(50), nullable=False)  
@@ -53,12 +58,13 @@ class Utente(db.Model, SerializerMixin):
     telefono = db.Column(db.String(20))  
     email = db.Column(db.String(100), nullable=False, unique=True)  
     password = db.Column(db.String(30), nullable=False) 
+    versione_prenotazioni = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    campi_esclusi = ('password',)
    
     rel_prenotazioni = db.relationship('Prenotazione', back_populates='rel_utente', lazy=True)
-    serialize_rules = ('-rel_prenotazioni.rel_utente',)
 
 
-class Prenotazione(db.Model, SerializerMixin):
+class Prenotazione(db.Model, SerializzatoreMixin):
     __tablename__ = 'prenotazioni'
     id = db.Column(db.Integer, primary_key=True)  
     utente_id = db.Column(db.Integer, db.ForeignKey('utenti.id'), nullable=False)  
@@ -67,7 +73,21 @@ class Prenotazione(db.Model, SerializerMixin):
 
     rel_utente = db.relationship('Utente', back_populates='rel_prenotazioni', lazy=True)
     rel_replica = db.relationship('Replica', back_populates='rel_prenotazioni', lazy=True)
-    serialize_rules = ('-rel_utente.rel_prenotazioni', '-rel_replica.rel_prenotazioni')
+
+    # L'indice unico copre anche le ricerche per utente_id (prefisso)
+    __table_args__ = (
+        db.Index('ux_prenotazioni_utente_replica', 'utente_id', 'replica_id', unique=True),
+        db.Index('ix_prenotazioni_replica_id', 'replica_id'),
+    )
+
+
+class TentativoLogin(db.Model):
+    # Contatori dei login falliti condivisi tra i worker: finestra corrente e precedente per chiave
+    __tablename__ = 'tentativi_login'
+    chiave = db.Column(db.String(120), primary_key=True)
+    indice = db.Column(db.Integer, nullable=False, index=True)
+    corrente = db.Column(db.Integer, nullable=False)
+    precedente = db.Column(db.Integer, nullable=False)
 
 def converti_datetime(dt_string):
     day, month, year, time = dt_string.split('-')
@@ -75,33 +95,167 @@ def converti_datetime(dt_string):
     return datetime(int(year), int(month), int(day), int(hour), int(minute), int(second))
 
 
-def init_db(app):
-    db.init_app(app)
-    with app.app_context():
-       
-        db.create_all()
-
-        if Utente.query.first() is None:
-            json_files = [
-                ('utenti.json', Utente),
-                ('prenotazioni.json', Prenotazione),
-                ('repliche.json', Replica),
-                ('eventi.json', Evento),
-                ('locali.json', Locale),
-            ]
-
-            for filename, model in json_files:
-                file_path = os.path.join(BASE_DIR, 'database', 'data_json', filename)
-                with open(file_path, 'r') as file:
-                    lista_record = json.load(file)
-                    
-                for record_dict in lista_record:
-                    if 'data_ora' in record_dict:
-                        record_dict['data_ora'] = converti_datetime(record_dict['data_ora'])
-                    new_record = model(**record_dict)
-                    db.session.add(new_record)
-            
-            db.session.commit()
+def aggiorna_schema():
+    # Aggiunge ai database esistenti colonne e indici introdotti dopo la loro creazione.
+    # Prima le colonne, così un indice nuovo può usare una colonna nuova
+    ispettore = inspect(db.engine)
+    aggiunte = []
+    for tabella in db.metadata.sorted_tables:
+        esistenti = {colonna['name'] for colonna in ispettore.get_columns(tabella.name)}
+        for colonna in tabella.columns:
+            if colonna.name in esistenti:
+                continue
+            ddl = f'ALTER TABLE {tabella.name} ADD COLUMN {colonna.name} {colonna.type.compile(db.engine.dialect)}'
+            if colonna.server_default is not None:
+                ddl += f" NOT NULL DEFAULT '{colonna.server_default.arg}'"
+            db.session.execute(text(ddl))
+            aggiunte.append(f'{tabella.name}.{colonna.name}')
+    for tabella in db.metadata.sorted_tables:
+        indici_esistenti = {indice['name'] for indice in ispettore.get_indexes(tabella.name)}
+        for indice in tabella.indexes:
+            if indice.name in indici_esistenti:
+                continue
+            if indice.unique:
+                rimuovi_duplicati(indice)
+            indice.create(db.session.connection())
+            aggiunte.append(indice.name)
+    db.session.commit()
+    return aggiunte
+
+
+def rimuovi_duplicati(indice):
+    # Un indice unico non si crea su righe già duplicate. Il vecchio /prenota non controllava
+    # le prenotazioni doppie: quelle si uniscono, per ogni altra tabella ci si ferma
+    colonne = list(indice.columns)
+    gruppi = db.session.query(*colonne).group_by(*colonne).having(func.count() > 1).count()
+    if not gruppi:
+        return
+    if indice.table is not Prenotazione.__table__:
+        raise RuntimeError(f'Impossibile creare {indice.name}: {gruppi} valori duplicati in {indice.table.name}.')
+    unite = unisci_prenotazioni_duplicate()
+    print(f'{indice.table.name}: {unite} prenotazioni duplicate unite ad altre {gruppi}')
+
+
+def unisci_prenotazioni_duplicate():
+    # Le prenotazioni di uno stesso utente per la stessa replica confluiscono nella prima,
+    # con la somma delle quantità: i posti occupati dalla replica non cambiano
+    doppie = (
+        db.session.query(
+            Prenotazione.utente_id, Prenotazione.replica_id,
+            func.min(Prenotazione.id), func.sum(Prenotazione.quantita), func.count()
+        )
+        .group_by(Prenotazione.utente_id, Prenotazione.replica_id)
+        .having(func.count() > 1)
+        .all()
+    )
+    unite = 0
+    for utente_id, replica_id, prima_id, quantita, numero in doppie:
+        db.session.query(Prenotazione).filter(Prenotazione.id == prima_id).update(
+            {Prenotazione.quantita: quantita}, synchronize_session=False
+        )
+        db.session.query(Prenotazione).filter(
+            Prenotazione.utente_id == utente_id,
+            Prenotazione.replica_id == replica_id,
+            Prenotazione.id != prima_id
+        ).delete(synchronize_session=False)
+        unite += numero - 1
+    return unite
+
+
+def riconcilia_posti():
+    # Ricalcola in blocco i contatori posti_prenotati a partire da prenotazioni
+    somma = (
+        db.session.query(func.coalesce(func.sum(Prenotazione.quantita), 0))
+        .filter(Prenotazione.replica_id == Replica.id)
+        .scalar_subquery()
+    )
+    derive = (
+        db.session.query(Replica.id, Replica.posti_prenotati, somma.label('posti_effettivi'))
+        .filter(Replica.posti_prenotati != somma)
+        .order_by(Replica.id)
+        .all()
+    )
+    if derive:
+        db.session.query(Replica).filter(Replica.posti_prenotati != somma).update(
+            {Replica.posti_prenotati: somma}, synchronize_session=False
+        )
+    db.session.commit()
+    return derive
+
+
+def leggi_json_a_flusso(percorso, blocco=1 << 16):
+    # Legge un array JSON di oggetti un record alla volta, senza caricare il file in memoria
+    decoder = json.JSONDecoder()
+    with open(percorso, 'r', encoding='utf-8') as file:
+        buffer = file.read(blocco).lstrip()
+        if not buffer.startswith('['):
+            raise ValueError(f'{percorso}: atteso un array JSON')
+        buffer = buffer[1:]
+        fine_file = False
+        while True:
+            buffer = buffer.lstrip().lstrip(',').lstrip()
+            if buffer.startswith(']'):
+                return
+            try:
+                record, posizione = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if fine_file:
+                    raise
+                altro = file.read(blocco)
+                fine_file = not altro
+                buffer += altro
+                continue
+            yield record
+            buffer = buffer[posizione:]
+
+
+def popola_db(cartella=None, dimensione_blocco=SEED_DIMENSIONE_BLOCCO):
+    # Inserimenti in blocco, una transazione per blocco, in ordine di chiavi esterne
+    cartella = cartella or os.path.join(BASE_DIR, 'database', 'data_json')
+    json_files = [
+        ('locali.json', Locale),
+        ('eventi.json', Evento),
+        ('repliche.json', Replica),
+        ('utenti.json', Utente),
+        ('prenotazioni.json', Prenotazione),
+    ]
+    totale = 0
+    inizio = time.perf_counter()
+    for filename, model in json_files:
+        righe = 0
+        blocco = []
+        for record_dict in leggi_json_a_flusso(os.path.join(cartella, filename)):
+            if 'data_ora' in record_dict:
+                record_dict['data_ora'] = converti_datetime(record_dict['data_ora'])
+            blocco.append(record_dict)
+            if len(blocco) == dimensione_blocco:
+                righe += inserisci_blocco(model, blocco)
+                blocco = []
+                print(f'{filename}: {righe} righe', end='\r', flush=True)
+        if blocco:
+            righe += inserisci_blocco(model, blocco)
+        print(f'{filename}: {righe} righe')
+        totale += righe
+    riconcilia_posti()
+    durata = time.perf_counter() - inizio
+    print(f'Caricate {totale} righe in {durata:.1f}s ({totale / max(durata, 1e-9):.0f} righe/s)')
+    return totale
+
+
+def inserisci_blocco(model, blocco):
+    db.session.execute(insert(model), blocco)
+    db.session.commit()
+    return len(blocco)
+
+
+def init_db():
+    db.create_all()
+    aggiunte = aggiorna_schema()
+    # Colonne nuove o prenotazioni duplicate unite: si riallineano i contatori dei posti
+    if aggiunte:
+        riconcilia_posti()
+    return aggiunte
+
 
 if __name__ == '__main__':
     init_db()
\ No newline at end of file
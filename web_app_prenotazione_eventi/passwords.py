@@ -0,0 +1,173 @@
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from itertools import repeat
+from flask import current_app
+from sqlalchemy import bindparam, update
+from werkzeug.security import generate_password_hash, check_password_hash
+from models import db, Utente
+from settings import PASSWORD_METODO
+
+
+class PoolSaturo(Exception):
+    pass
+
+
+def calcola_hash(password, metodo=PASSWORD_METODO):
+    return generate_password_hash(password, method=metodo)
+
+
+def verifica_hash(password_hash, password):
+    return check_password_hash(password_hash, password)
+
+
+def nuovo_esecutore(processi):
+    # spawn: i processi non ereditano i thread e le connessioni del server
+    return ProcessPoolExecutor(processi, mp_context=multiprocessing.get_context('spawn'))
+
+
+class PoolHash:
+    # Hash e verifiche delle password girano in processi separati: il thread della richiesta
+    # aspetta senza tenere il GIL. Oltre coda_massima operazioni in corso si rifiuta subito
+    def __init__(self, processi, coda_massima, timeout):
+        self.processi = processi
+        self.coda_massima = coda_massima
+        self.timeout = timeout
+        self.esecutore = None
+        self.in_corso = 0
+        self.lock = threading.Lock()
+        self.metriche = {}
+
+    def avvia(self, rotto=None):
+        # Con rotto si sostituisce quell'esecutore, a meno che un altro thread non l'abbia già fatto
+        with self.lock:
+            if self.esecutore is rotto:
+                if rotto is not None:
+                    rotto.shutdown(wait=False, cancel_futures=True)
+                self.esecutore = nuovo_esecutore(self.processi)
+            return self.esecutore
+
+    def esegui(self, funzione, *args):
+        esecutore = self.esecutore or self.avvia()
+        try:
+            return self.attendi(esecutore, funzione, args)
+        except BrokenProcessPool:
+            # Un processo del pool è terminato (per esempio ucciso per memoria) e l'esecutore
+            # non accetta più lavoro: si sostituisce e l'operazione, senza effetti, si ripete una volta
+            current_app.logger.warning('Pool degli hash non più utilizzabile: viene ricreato')
+            return self.attendi(self.avvia(esecutore), funzione, args)
+
+    def attendi(self, esecutore, funzione, args):
+        nome = funzione.__name__
+        with self.lock:
+            metrica = self.metriche.setdefault(nome, {'chiamate': 0, 'rifiutate': 0, 'totale_ms': 0.0, 'massimo_ms': 0.0})
+            if self.in_corso >= self.coda_massima:
+                metrica['rifiutate'] += 1
+                raise PoolSaturo()
+            self.in_corso += 1
+        inizio = time.perf_counter()
+        try:
+            futuro = esecutore.submit(funzione, *args)
+        except BaseException:
+            self.libera()
+            raise
+        # Il posto si libera quando l'operazione finisce davvero (o viene ritirata), non quando
+        # la richiesta smette di aspettare: in_corso resta la coda reale dell'esecutore
+        futuro.add_done_callback(self.libera)
+        try:
+            return futuro.result(timeout=self.timeout)
+        except TimeoutError:
+            # Se è ancora in coda si ritira; se un processo la sta già calcolando occupa il posto fino alla fine
+            futuro.cancel()
+            with self.lock:
+                metrica['rifiutate'] += 1
+            raise PoolSaturo()
+        finally:
+            durata = (time.perf_counter() - inizio) * 1000
+            with self.lock:
+                metrica['chiamate'] += 1
+                metrica['totale_ms'] += durata
+                metrica['massimo_ms'] = max(metrica['massimo_ms'], durata)
+
+    def libera(self, futuro=None):
+        with self.lock:
+            self.in_corso -= 1
+
+    def statistiche(self):
+        with self.lock:
+            return {
+                'processi': self.processi,
+                'in_corso': self.in_corso,
+                'coda_massima': self.coda_massima,
+                'operazioni': {
+                    nome: {
+                        'chiamate': metrica['chiamate'],
+                        'rifiutate': metrica['rifiutate'],
+                        'media_ms': round(metrica['totale_ms'] / metrica['chiamate'], 2) if metrica['chiamate'] else 0,
+                        'massimo_ms': round(metrica['massimo_ms'], 2)
+                    }
+                    for nome, metrica in self.metriche.items()
+                }
+            }
+
+
+def hash_password(password):
+    return current_app.extensions['pool_hash'].esegui(calcola_hash, password)
+
+
+def controlla_password(password_hash, password):
+    return current_app.extensions['pool_hash'].esegui(verifica_hash, password_hash, password)
+
+
+def da_aggiornare(password_hash):
+    # Hash creato con parametri diversi dalla politica attuale (per esempio quelli della migrazione)
+    return password_hash.split('$', 1)[0] != PASSWORD_METODO
+
+
+def aggiorna_hash(utente_id, vecchio_hash, password):
+    # Aggiornamento ottimistico: se nel frattempo l'hash è cambiato non si sovrascrive
+    nuovo_hash = hash_password(password)
+    db.session.query(Utente).filter(Utente.id == utente_id, Utente.password == vecchio_hash).update(
+        {Utente.password: nuovo_hash}, synchronize_session=False
+    )
+    db.session.commit()
+
+
+def filtro_in_chiaro():
+    return Utente.password.notlike('pbkdf2:%') & Utente.password.notlike('scrypt:%')
+
+
+def converti_password_in_chiaro(processi, blocco, metodo):
+    # Keyset sugli id: ogni blocco di password in chiaro si calcola in parallelo su tutti i processi
+    # e si scrive in una transazione. L'UPDATE controlla anche il valore letto, per non
+    # sovrascrivere una password cambiata durante la conversione
+    aggiorna = (
+        update(Utente.__table__)
+        .where(Utente.__table__.c.id == bindparam('u_id'), Utente.__table__.c.password == bindparam('u_vecchia'))
+        .values(password=bindparam('u_nuova'))
+    )
+    ultimo_id = 0
+    with nuovo_esecutore(processi) as esecutore:
+        while True:
+            righe = (
+                db.session.query(Utente.id, Utente.password)
+                .filter(Utente.id > ultimo_id, filtro_in_chiaro())
+                .order_by(Utente.id)
+                .limit(blocco)
+                .all()
+            )
+            if not righe:
+                break
+            ultimo_id = righe[-1][0]
+            hash_calcolati = esecutore.map(
+                calcola_hash, [password for _, password in righe], repeat(metodo),
+                chunksize=max(1, len(righe) // (processi * 4))
+            )
+            db.session.execute(aggiorna, [
+                {'u_id': utente_id, 'u_vecchia': password, 'u_nuova': nuovo_hash}
+                for (utente_id, password), nuovo_hash in zip(righe, hash_calcolati)
+            ])
+            db.session.commit()
+            yield len(righe)
@@ -0,0 +1,129 @@
+from datetime import datetime
+from itertools import groupby
+from sqlalchemy import func, tuple_
+from settings import EVENTI_PER_PAGINA, PRENOTAZIONI_PER_PAGINA
+from models import db, Evento, Locale, Replica, Utente, Prenotazione
+from serializers import Serializzatore, formatta_data_ora
+
+
+COLONNE_EVENTO = (
+    Evento.id,
+    Evento.nome_evento,
+    Locale.nome_locale.label('locale'),
+    Locale.luogo,
+    Evento.image_url
+)
+COLONNE_REPLICA = (
+    Replica.id,
+    Replica.data_ora,
+    Replica.annullato,
+    (Locale.posti - Replica.posti_prenotati).label('posti_disponibili')
+)
+COLONNE_PRENOTAZIONE = (
+    Prenotazione.id,
+    Evento.nome_evento.label('evento'),
+    Locale.nome_locale.label('locale'),
+    Replica.data_ora,
+    Prenotazione.quantita,
+    Replica.annullato,
+    Prenotazione.replica_id
+)
+serializza_evento = Serializzatore.da_colonne(COLONNE_EVENTO)
+serializza_replica = Serializzatore.da_colonne(COLONNE_REPLICA, {'data_ora': formatta_data_ora})
+serializza_prenotazione = Serializzatore.da_colonne(COLONNE_PRENOTAZIONE, {'data_ora': formatta_data_ora})
+
+
+def catalogo_eventi(evento_id=None, id_eventi=None):
+    # Un'unica query: eventi ⨝ locali ⨝ repliche, con i posti letti dal contatore sulla replica.
+    # La paginazione della home è in versioni_eventi: qui arrivano solo gli id da renderizzare
+    query = (
+        db.session.query(*COLONNE_EVENTO, *COLONNE_REPLICA)
+        .join(Locale, Evento.locale_id == Locale.id)
+        .outerjoin(Replica, Replica.evento_id == Evento.id)
+    )
+    if evento_id is not None:
+        query = query.filter(Evento.id == evento_id)
+    if id_eventi is not None:
+        query = query.filter(Evento.id.in_(id_eventi))
+    righe = query.order_by(Evento.id, Replica.id).all()
+
+    # Ogni riga è (colonne evento, colonne replica): l'evento si serializza una volta per gruppo
+    n = len(COLONNE_EVENTO)
+    eventi_data = []
+    for _, gruppo in groupby(righe, key=lambda riga: riga[0]):
+        gruppo = list(gruppo)
+        evento = serializza_evento.riga(gruppo[0][:n])
+        evento['repliche'] = serializza_replica.righe(riga[n:] for riga in gruppo if riga[n] is not None)
+        eventi_data.append(evento)
+    return eventi_data
+
+
+def pagina_con_cursore(elementi, limit):
+    if len(elementi) > limit:
+        return elementi[:limit], elementi[limit - 1]['id']
+    return elementi, None
+
+
+# Versione economica di un evento: solo l'indice sulle repliche e i contatori di versione
+COLONNE_VERSIONE = (func.count(Replica.id), func.max(Replica.id), func.total(Replica.versione))
+
+
+def formatta_versione(numero, ultimo_id, versioni):
+    return f'{numero}-{ultimo_id}-{int(versioni)}'
+
+
+def etag_evento(evento_id):
+    riga = db.session.query(*COLONNE_VERSIONE).filter(Replica.evento_id == evento_id).one()
+    if not riga[0]:
+        return None
+    return f'e{evento_id}-' + formatta_versione(*riga)
+
+
+def versioni_eventi(after=None, limit=EVENTI_PER_PAGINA):
+    # Versione di disponibilità di ogni evento della pagina, con la stessa paginazione keyset del catalogo
+    pagina = db.session.query(Evento.id)
+    if after is not None:
+        pagina = pagina.filter(Evento.id > after)
+    pagina = pagina.order_by(Evento.id).limit(limit + 1).subquery()
+    righe = (
+        db.session.query(pagina.c.id, *COLONNE_VERSIONE)
+        .outerjoin(Replica, Replica.evento_id == pagina.c.id)
+        .group_by(pagina.c.id)
+        .order_by(pagina.c.id)
+        .all()
+    )
+    return pagina_con_cursore([{'id': riga[0], 'versione': formatta_versione(*riga[1:])} for riga in righe], limit)
+
+
+def etag_prenotazioni(utente_id, after, limit):
+    versione = db.session.query(Utente.versione_prenotazioni).filter(Utente.id == utente_id).scalar()
+    return f'u{utente_id}-{versione}-{after or 0}-{limit}'
+
+
+def cursore_prenotazione(riga):
+    # Il cursore contiene la chiave di ordinamento completa: resta valido anche se
+    # la prenotazione a cui si riferisce viene cancellata
+    return f'{riga.data_ora.isoformat()}_{riga.id}'
+
+
+def leggi_cursore_prenotazione(testo):
+    # ValueError se il cursore non è nel formato di cursore_prenotazione
+    data_ora, _, prenotazione_id = testo.rpartition('_')
+    return datetime.fromisoformat(data_ora), int(prenotazione_id)
+
+
+def prenotazioni_utente(utente_id, after=None, limit=PRENOTAZIONI_PER_PAGINA):
+    # Proiezione su prenotazioni ⨝ repliche ⨝ eventi ⨝ locali: una sola query per pagina,
+    # ordinata per (data_ora, id) e con cursore keyset (data_ora, id) dell'ultima riga restituita.
+    # Restituisce un iteratore di al massimo limit + 1 righe, letto direttamente dal cursore;
+    # si serializzano con serializza_prenotazione.righe
+    query = (
+        db.session.query(*COLONNE_PRENOTAZIONE)
+        .join(Replica, Prenotazione.replica_id == Replica.id)
+        .join(Evento, Replica.evento_id == Evento.id)
+        .join(Locale, Evento.locale_id == Locale.id)
+        .filter(Prenotazione.utente_id == utente_id)
+    )
+    if after is not None:
+        query = query.filter(tuple_(Replica.data_ora, Prenotazione.id) > tuple_(*after))
+    return query.order_by(Replica.data_ora, Prenotazione.id).limit(limit + 1).yield_per(limit + 1)
@@ -0,0 +1,91 @@
+import os
+import re
+import sys
+import threading
+from functools import lru_cache
+from flask import current_app, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from settings import BASE_DIR, N_PIU_UNO_SOGLIA, N_PIU_UNO_ERRORE
+
+
+class QueryRipetute(Exception):
+    pass
+
+
+# Conteggi per impronta della richiesta in corso nel thread (None fuori dalle richieste)
+stato = threading.local()
+
+LETTERALI = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+LISTE = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+SPAZI = re.compile(r'\s+')
+
+
+@lru_cache(maxsize=1024)
+def impronta_sql(statement):
+    # Stessa forma della query a prescindere da letterali e lunghezza delle liste IN
+    testo = LETTERALI.sub('?', SPAZI.sub(' ', statement))
+    return LISTE.sub('(?)', testo).strip()
+
+
+def origine_query():
+    # Risale lo stack: il primo frame del progetto e, se la query parte da un template,
+    # la riga del template ricavata dal codice compilato da Jinja
+    codice = None
+    template = None
+    frame = sys._getframe(2)
+    while frame is not None:
+        modello = frame.f_globals.get('__jinja_template__')
+        if modello is not None:
+            if template is None:
+                template = f"{modello.name or '<stringa>'}:{modello.get_corresponding_lineno(frame.f_lineno)}"
+        elif codice is None and frame.f_code.co_filename.startswith(BASE_DIR) and frame.f_code.co_filename != __file__:
+            codice = f'{os.path.relpath(frame.f_code.co_filename, BASE_DIR)}:{frame.f_lineno} ({frame.f_code.co_name})'
+        frame = frame.f_back
+    return codice, template
+
+
+def registra_query(conn, cursor, statement, parameters, context, executemany):
+    conteggi = getattr(stato, 'conteggi', None)
+    if conteggi is None:
+        return
+    impronta = impronta_sql(statement)
+    numero = conteggi.get(impronta, 0) + 1
+    conteggi[impronta] = numero
+    # Lo stack si esamina una volta sola, quando l'impronta supera la soglia
+    if numero == N_PIU_UNO_SOGLIA + 1:
+        stato.origini[impronta] = origine_query()
+
+
+def configura_rilevatore(app):
+    # Solo per sviluppo e staging: con N_PIU_UNO_ERRORE la richiesta fallisce (utile nei test)
+    if not event.contains(Engine, 'before_cursor_execute', registra_query):
+        event.listen(Engine, 'before_cursor_execute', registra_query)
+
+    @app.before_request
+    def inizio_conteggio():
+        stato.conteggi = {}
+        stato.origini = {}
+
+    @app.after_request
+    def controlla_conteggio(risposta):
+        conteggi = getattr(stato, 'conteggi', None) or {}
+        messaggi = []
+        for impronta, numero in conteggi.items():
+            if numero > N_PIU_UNO_SOGLIA:
+                codice, template = stato.origini.get(impronta, (None, None))
+                messaggio = f'Possibile N+1 in {request.endpoint}: {numero} esecuzioni di "{impronta[:300]}"'
+                if codice:
+                    messaggio += f', da {codice}'
+                if template:
+                    messaggio += f', template {template}'
+                messaggi.append(messaggio)
+        if messaggi and N_PIU_UNO_ERRORE:
+            raise QueryRipetute('\n'.join(messaggi))
+        for messaggio in messaggi:
+            current_app.logger.warning(messaggio)
+        return risposta
+
+    @app.teardown_request
+    def fine_conteggio(errore):
+        stato.conteggi = None
@@ -0,0 +1,113 @@
+from models import db, Evento, Locale, Replica, Utente, Prenotazione
+
+
+class PrenotazioneRifiutata(Exception):
+    def __init__(self, messaggio, status=400):
+        super().__init__(messaggio)
+        self.messaggio = messaggio
+        self.status = status
+
+
+def valida_quantita(valore):
+    try:
+        quantita = int(valore)
+    except (TypeError, ValueError):
+        raise PrenotazioneRifiutata('Quantità non valida.')
+    if quantita < 1:
+        raise PrenotazioneRifiutata('Quantità non valida.')
+    return quantita
+
+
+def occupa_posti(replica_id, quantita):
+    # UPDATE condizionale: è la prima scrittura della transazione, quindi il lock
+    # di scrittura viene preso solo qui e rilasciato subito dopo il commit
+    capienza = (
+        db.session.query(Locale.posti)
+        .join(Evento, Evento.locale_id == Locale.id)
+        .filter(Evento.id == Replica.evento_id)
+        .scalar_subquery()
+    )
+    occupate = db.session.query(Replica).filter(
+        Replica.id == replica_id,
+        Replica.annullato.isnot(True),
+        Replica.posti_prenotati + quantita <= capienza
+    ).update(
+        {Replica.posti_prenotati: Replica.posti_prenotati + quantita, Replica.versione: Replica.versione + 1},
+        synchronize_session=False
+    )
+    if occupate:
+        return
+    replica = db.session.get(Replica, replica_id)
+    if replica is None:
+        raise PrenotazioneRifiutata('Replica non trovata.', 404)
+    if replica.annullato:
+        raise PrenotazioneRifiutata('Questa replica è stata annullata.')
+    raise PrenotazioneRifiutata('Posti esauriti per questa replica.', 409)
+
+
+def libera_posti(replica_id, quantita):
+    db.session.query(Replica).filter(Replica.id == replica_id).update(
+        {Replica.posti_prenotati: Replica.posti_prenotati - quantita, Replica.versione: Replica.versione + 1},
+        synchronize_session=False
+    )
+
+
+def incrementa_versione_utente(utente_id):
+    # La versione delle prenotazioni dell'utente alimenta l'ETag di /api/prenotazioni
+    db.session.query(Utente).filter(Utente.id == utente_id).update(
+        {Utente.versione_prenotazioni: Utente.versione_prenotazioni + 1},
+        synchronize_session=False
+    )
+
+
+def stato_replica(replica_id):
+    # Stato della replica dopo la scrittura, letto nella stessa transazione
+    riga = (
+        db.session.query(
+            Replica.id,
+            Replica.evento_id,
+            Replica.annullato,
+            (Locale.posti - Replica.posti_prenotati).label('posti_disponibili')
+        )
+        .join(Evento, Replica.evento_id == Evento.id)
+        .join(Locale, Evento.locale_id == Locale.id)
+        .filter(Replica.id == replica_id)
+        .one()
+    )
+    return riga._asdict()
+
+
+def crea_prenotazione(utente_id, replica_id, quantita):
+    occupa_posti(replica_id, quantita)
+    prenotazione = Prenotazione(utente_id=utente_id, replica_id=replica_id, quantita=quantita)
+    db.session.add(prenotazione)
+    incrementa_versione_utente(utente_id)
+    return stato_replica(replica_id)
+
+
+def carica_prenotazione(prenotazione_id):
+    prenotazione = db.session.get(Prenotazione, prenotazione_id)
+    if prenotazione is None:
+        raise PrenotazioneRifiutata('Prenotazione non trovata.', 404)
+    return prenotazione
+
+
+def modifica_prenotazione(prenotazione_id, nuova_quantita):
+    # Le operazioni ricevono solo id: possono girare anche nella sessione dello scrittore di gruppo
+    prenotazione = carica_prenotazione(prenotazione_id)
+    delta = nuova_quantita - prenotazione.quantita
+    if delta > 0:
+        occupa_posti(prenotazione.replica_id, delta)
+    elif delta < 0:
+        libera_posti(prenotazione.replica_id, -delta)
+    prenotazione.quantita = nuova_quantita
+    incrementa_versione_utente(prenotazione.utente_id)
+    return stato_replica(prenotazione.replica_id)
+
+
+def cancella_prenotazione(prenotazione_id):
+    prenotazione = carica_prenotazione(prenotazione_id)
+    libera_posti(prenotazione.replica_id, prenotazione.quantita)
+    db.session.delete(prenotazione)
+    incrementa_versione_utente(prenotazione.utente_id)
+    return stato_replica(prenotazione.replica_id)
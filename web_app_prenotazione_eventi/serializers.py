@@ -0,0 +1,55 @@
+from functools import lru_cache
+from sqlalchemy import Column, DateTime
+
+FORMATO_DATA_ORA = '%d-%m-%Y %H:%M'
+
+
+@lru_cache(maxsize=4096)
+def formatta_data_ora(valore):
+    # Molte righe condividono la stessa data (una per replica): ogni valore si formatta una volta sola
+    if valore is None:
+        return None
+    return valore.strftime(FORMATO_DATA_ORA)
+
+
+class Serializzatore:
+    # Campi e formattatori risolti una volta: ogni riga (tupla) diventa un dict con un solo zip
+    def __init__(self, campi, formattatori=None):
+        self.campi = tuple(campi)
+        formattatori = formattatori or {}
+        self.formattatori = tuple(
+            (indice, formattatori[campo]) for indice, campo in enumerate(self.campi) if campo in formattatori
+        )
+
+    @classmethod
+    def da_colonne(cls, colonne, formattatori=None):
+        return cls([colonna.key for colonna in colonne], formattatori)
+
+    def riga(self, valori):
+        if self.formattatori:
+            valori = list(valori)
+            for indice, formattatore in self.formattatori:
+                valori[indice] = formattatore(valori[indice])
+        return dict(zip(self.campi, valori))
+
+    def righe(self, righe):
+        riga = self.riga
+        return [riga(valori) for valori in righe]
+
+
+class SerializzatoreMixin:
+    # Sostituisce SerializerMixin: le colonne serializzate si fissano alla definizione della classe
+    campi_esclusi = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        colonne = {
+            nome: valore for nome, valore in vars(cls).items()
+            if isinstance(valore, Column) and nome not in cls.campi_esclusi
+        }
+        cls.serializzatore = Serializzatore(colonne, {
+            nome: formatta_data_ora for nome, colonna in colonne.items() if isinstance(colonna.type, DateTime)
+        })
+
+    def to_dict(self):
+        return self.serializzatore.riga(tuple(getattr(self, campo) for campo in self.serializzatore.campi))
@@ -2,4 +2,99 @@ import os
 
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 
-DATABASE_PATH = os.path.join(BASE_DIR, 'database', 'db.sqlite3')
\ No newline at end of file
+DATABASE_PATH = os.path.join(BASE_DIR, 'database', 'db.sqlite3')
+
+EVENTI_PER_PAGINA = 30
+PRENOTAZIONI_PER_PAGINA = 20
+LIMITE_MASSIMO_PAGINA = 100
+
+# Pragma applicati a ogni nuova connessione SQLite
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 268435456,
+    'cache_size': -65536,
+    'temp_store': 'MEMORY',
+}
+# Retry dei commit delle prenotazioni su "database is locked" (attese in secondi)
+SQLITE_TENTATIVI_COMMIT = 5
+SQLITE_ATTESA_BASE = 0.01
+SQLITE_ATTESA_MASSIMA = 0.2
+
+# Scrittore di gruppo: raccoglie le scritture delle prenotazioni e le committa insieme
+GROUP_COMMIT = False
+GROUP_COMMIT_FINESTRA = 0.005
+GROUP_COMMIT_LOTTO_MASSIMO = 200
+# Attesa massima (secondi) di una richiesta per l'esito della sua scrittura, poi 503
+GROUP_COMMIT_TIMEOUT = 10
+
+# Righe per transazione durante il caricamento dei dati JSON
+SEED_DIMENSIONE_BLOCCO = 5000
+
+# Politica degli hash delle password: gli hash con parametri diversi si aggiornano al login
+PASSWORD_METODO = 'pbkdf2:sha256:600000'
+# Hash più leggero usato solo per convertire in blocco le password in chiaro importate
+PASSWORD_METODO_MIGRAZIONE = 'pbkdf2:sha256:10000'
+PASSWORD_BLOCCO_MIGRAZIONE = 2000
+# La conversione gira da riga di comando, fuori dai worker: usa tutte le CPU
+PASSWORD_PROCESSI_MIGRAZIONE = os.cpu_count() or 2
+
+# Rilevatore di query N+1 (sviluppo e staging): stessa query ripetuta più di N_PIU_UNO_SOGLIA volte
+# in una richiesta. Con N_PIU_UNO_ERRORE la richiesta fallisce invece di scrivere un avviso nel log
+RILEVA_N_PIU_UNO = False
+N_PIU_UNO_SOGLIA = 5
+N_PIU_UNO_ERRORE = False
+
+# Limiti (secondi) dei bucket dell'istogramma delle latenze esposto su /metrics
+METRICHE_BUCKET_LATENZA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Login falliti ammessi per email e per IP nella finestra scorrevole (secondi).
+# Con LOGIN_CONTATORI_CONDIVISI i contatori stanno nel database e valgono per tutti i worker
+LOGIN_FINESTRA = 900
+LOGIN_LIMITE_EMAIL = 5
+LOGIN_LIMITE_IP = 50
+LOGIN_CONTATORI_CONDIVISI = False
+# Reverse proxy fidati davanti all'applicazione (per esempio nginx): con un valore maggiore di zero
+# l'IP del client si legge da X-Forwarded-For, altrimenti ogni passeggero avrebbe l'IP del proxy.
+# Con zero l'intestazione si ignora: un client non può scegliersi l'IP da solo
+PROXY_FIDATI = 0
+
+# Processi del server che eseguono l'applicazione (per esempio i worker di gunicorn)
+WORKER_WEB = 1
+
+# Hash delle password in un pool di processi: oltre POOL_HASH_CODA_MASSIMA operazioni in corso si risponde 503.
+# Pool e coda sono per processo del server: CPU e coda complessiva (64) si dividono tra i WORKER_WEB processi
+POOL_HASH_PROCESSI = max(1, (os.cpu_count() or 2) // WORKER_WEB)
+POOL_HASH_CODA_MASSIMA = max(1, 64 // WORKER_WEB)
+POOL_HASH_TIMEOUT = 10
+
+# Stream SSE della disponibilità: messaggi in coda per client e secondi tra due keepalive
+SSE_CODA_MASSIMA = 100
+SSE_KEEPALIVE = 15
+
+# Bytecode dei template Jinja su disco, condiviso dai worker e riusato dopo un riavvio
+JINJA_CACHE_DIR = os.path.join(BASE_DIR, 'jinja_cache')
+PRECOMPILA_TEMPLATE = True
+
+# Derivate ridimensionate delle immagini degli eventi (generate da "flask compila-immagini" dentro static/)
+IMMAGINI_SORGENTI = 'images'
+IMMAGINI_CARTELLA = 'images/derivate'
+IMMAGINI_MANIFEST = 'derivate.json'
+IMMAGINI_LARGHEZZE = (320, 640, 960)
+IMMAGINI_QUALITA = 80
+
+# Asset statici con impronta nel nome (generati da "flask compila-asset" dentro static/)
+ASSET_CARTELLA = 'dist'
+ASSET_MANIFEST = 'manifest.json'
+ASSET_COMPRIMIBILI = ('.css', '.js', '.svg', '.json', '.txt')
+ASSET_MAX_AGE = 31536000
+
+# Tempo massimo (ms) per importare app e creare l'applicazione, verificato da "flask tempo-avvio"
+BUDGET_AVVIO_MS = 500
+
+# Numero massimo di eventi con la risposta di /api/repliche in cache
+CACHE_REPLICHE_CAPIENZA = 256
+
+# Numero massimo di card degli eventi (frammenti HTML della home) in cache
+CACHE_CARD_CAPIENZA = 512
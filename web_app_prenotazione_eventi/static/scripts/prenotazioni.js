@@ -4,29 +4,47 @@ document.addEventListener('DOMContentLoaded', init);
 
 
 //2. Inizializzazione
+let prossimoCursore = null;
+let caricamentoInCorso = false;
+const osservatore = new IntersectionObserver(handleSentinella);
+
 function init() {
     fetchPrenotazioni();
 }
 
 
-//3. Recupero delle prenotazioni
-function fetchPrenotazioni() {
-    fetch('/api/prenotazioni')
+//3. Recupero delle prenotazioni, una pagina alla volta a partire dal cursore
+function fetchPrenotazioni(after) {
+    caricamentoInCorso = true;
+    const url = after ? `/api/prenotazioni?after=${encodeURIComponent(after)}` : '/api/prenotazioni';
+    fetch(url)
     .then(response => {
         if (!response.ok) {
             throw new Error('Errore nel recupero delle prenotazioni');
         }
         return response.json();
     })
-    .then(displayPrenotazioni)
-    .catch(handleError);
+    .then(data => after ? appendPrenotazioni(data) : displayPrenotazioni(data))
+    .catch(handleError)
+    .finally(() => { caricamentoInCorso = false; });
+}
+
+
+//3.A Caricamento della pagina successiva quando la fine della tabella diventa visibile
+function handleSentinella(entries) {
+    if (entries[0].isIntersecting && prossimoCursore && !caricamentoInCorso) {
+        fetchPrenotazioni(prossimoCursore);
+    }
 }
 
 
 //4. Visualizzazione delle prenotazioni
 //2. Gestione-Prenotazioni! 
-function displayPrenotazioni(prenotazioni) {
+function displayPrenotazioni(data) {
     const container = document.getElementById('prenotazioni-container');
+    const prenotazioni = data.prenotazioni;
+    prossimoCursore = data.next;
+    osservatore.disconnect();
     if (prenotazioni.length === 0) {
         container.innerHTML = '<p>Non hai ancora effettuato prenotazioni.</p>';
     } else {
@@ -43,18 +61,39 @@ function displayPrenotazioni(prenotazioni) {
                         <th>Azioni</th>
                     </tr>
                 </thead>
-                <tbody>${rows}</tbody>
+                <tbody id="prenotazioni-body">${rows}</tbody>
             </table>
+            <div id="prenotazioni-sentinella"></div>
         `;
+        osservaSentinella();
     }
 }
 
 
+//4.A Aggiunta in coda delle righe di una pagina successiva
+function appendPrenotazioni(data) {
+    prossimoCursore = data.next;
+    const rows = data.prenotazioni.map(createPrenotazioneRow).join('');
+    document.getElementById('prenotazioni-body').insertAdjacentHTML('beforeend', rows);
+    osservaSentinella();
+}
+
+
+//4.B L'osservatore segnala solo i cambi di visibilità: se la sentinella è ancora visibile
+//    dopo una pagina corta non arriverebbe altro. Osservarla di nuovo produce una notifica
+//    con lo stato attuale, che carica la pagina successiva se serve
+function osservaSentinella() {
+    const sentinella = document.getElementById('prenotazioni-sentinella');
+    osservatore.unobserve(sentinella);
+    osservatore.observe(sentinella);
+}
+
+
 //5 5. Creazione delle righe della tabella
 
 function createPrenotazioneRow(p) {
     return `
-        <tr>
+        <tr id="prenotazione-${p.id}">
             <td>${p.evento}</td>
             <td>${p.locale}</td>
             <td>${p.data_ora}</td>
@@ -113,7 +152,8 @@ function updatePrenotazione(prenotazioneId, nuovaQuantita) {
 function handleUpdateResponse(data) {
     if (data.message) {
         alert(data.message);
-        fetchPrenotazioni(); 
+        // Si aggiorna solo la riga modificata, senza ricaricare l'elenco
+        document.getElementById(`quantita-${data.prenotazione.id}`).value = data.prenotazione.quantita;
     } else if (data.error) {
         alert(data.error);
     }
@@ -156,12 +196,26 @@ function deletePrenotazione(prenotazioneId) {
 function handleDeleteResponse(data) {
     if (data.message) {
         alert(data.message);
-        fetchPrenotazioni();
+        rimuoviPrenotazione(data.prenotazione_id);
     } else if (data.error) {
         alert(data.error);
     }
 }
 
+//8.A Rimozione della riga cancellata
+function rimuoviPrenotazione(prenotazioneId) {
+    const riga = document.getElementById(`prenotazione-${prenotazioneId}`);
+    if (!riga) {
+        return;
+    }
+    // Il cursore contiene data e id dell'ultima riga: resta valido anche se era quella cancellata
+    const corpo = riga.parentElement;
+    riga.remove();
+    if (corpo.children.length === 0) {
+        displayPrenotazioni({prenotazioni: [], next: null});
+    }
+}
+
 function handleDeleteError(error) {
     console.error('Error:', error);
     alert('Si è verificato un errore durante la cancellazione della prenotazione.');
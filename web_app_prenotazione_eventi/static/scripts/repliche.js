@@ -2,9 +2,46 @@ document.addEventListener('DOMContentLoaded', initRepliche);
 
 function initRepliche() {
     const eventoId = document.getElementById('repliche-container').dataset.eventoId;
+    avviaStream(eventoId);
     loadRepliche(eventoId);
 }
 
+// Disponibilità in tempo reale: il server invia la replica modificata a ogni prenotazione
+function avviaStream(eventoId) {
+    if (!window.EventSource) {
+        return;
+    }
+    const sorgente = new EventSource(`/api/repliche/${eventoId}/stream`);
+    let riconnessione = false;
+    sorgente.addEventListener('posti', event => aggiornaReplica(JSON.parse(event.data)));
+    sorgente.addEventListener('error', () => {
+        riconnessione = true;
+    });
+    sorgente.addEventListener('open', () => {
+        // Gli aggiornamenti persi durante la disconnessione non vengono ripetuti: si ricarica tutto
+        if (riconnessione) {
+            riconnessione = false;
+            loadRepliche(eventoId);
+        }
+    });
+}
+
+function aggiornaReplica(replica) {
+    const posti = document.getElementById(`posti-${replica.id}`);
+    if (!posti) {
+        return;
+    }
+    posti.textContent = replica.posti_disponibili;
+    const quantita = document.getElementById(`quantita-${replica.id}`);
+    const bottone = document.getElementById(`prenota-${replica.id}`);
+    if (quantita) {
+        quantita.max = replica.posti_disponibili;
+    }
+    if (bottone) {
+        bottone.disabled = replica.posti_disponibili <= 0;
+    }
+}
+
 function loadRepliche(eventoId) {
     fetch(`/api/repliche/${eventoId}`)
         .then(response => response.json())
@@ -30,7 +67,7 @@ function createReplicaCard(replica) {
             <div class="card">
                 <div class="card-body">
                     <h5 class="card-title">${replica.data_ora}</h5>
-                    <p class="card-text">Posti disponibili: ${replica.posti_disponibili}</p>
+                    <p class="card-text">Posti disponibili: <span id="posti-${replica.id}">${replica.posti_disponibili}</span></p>
                     ${replica.annullato 
                         ? '<p class="text-danger">Questa replica è stata annullata.</p>'
                         : `
@@ -39,7 +76,7 @@ function createReplicaCard(replica) {
                                     <label for="quantita-${replica.id}" class="form-label">Quantità:</label>
                                     <input type="number" class="form-control" id="quantita-${replica.id}" name="quantita" value="1" min="1" max="${replica.posti_disponibili}">
                                 </div>
-                                <button type="submit" class="btn btn-dark">Prenota</button>
+                                <button type="submit" class="btn btn-dark" id="prenota-${replica.id}" ${replica.posti_disponibili > 0 ? '' : 'disabled'}>Prenota</button>
                             </form>
                         `
                     }
@@ -75,8 +112,8 @@ function createPrenotazione(replicaId, quantita) {
 function handlePrenotazioneResponse(data) {
     if (data.message) {
         alert(data.message);
-        const eventoId = document.getElementById('repliche-container').dataset.eventoId;
-        loadRepliche(eventoId);
+        // La risposta contiene già la disponibilità aggiornata della replica
+        aggiornaReplica(data.replica);
     } else if (data.error) {
         alert(data.error);
     }
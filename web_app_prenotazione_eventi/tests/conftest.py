@@ -0,0 +1,34 @@
+import os
+import sys
+
+import pytest
+
+# I moduli dell'applicazione si importano con percorsi piatti (from models import ...)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from models import db, init_db
+
+
+@pytest.fixture
+def config_app():
+    # Configurazione aggiuntiva dell'app: i test la cambiano con @pytest.mark.parametrize('config_app', ...)
+    return {}
+
+
+@pytest.fixture
+def app(tmp_path, config_app):
+    # Database SQLite temporaneo con lo schema completo, vuoto
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / 'test.sqlite3'), 'TESTING': True, **config_app
+    })
+    with app.app_context():
+        init_db()
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
@@ -0,0 +1,19 @@
+import json
+
+import pytest
+from flask import jsonify
+from flask.json.provider import DefaultJSONProvider
+
+
+def test_chiavi_non_stringa_come_il_provider_di_flask(app):
+    # orjson accetta solo chiavi stringa: il provider deve comportarsi come quello di Flask
+    dati = {1: 'a', 2: [1, 2]}
+    atteso = DefaultJSONProvider(app).dumps(dati)
+    assert json.loads(app.json.dumps(dati)) == json.loads(atteso)
+    with app.test_request_context():
+        assert jsonify(dati).get_json() == {'1': 'a', '2': [1, 2]}
+
+
+def test_tipi_non_serializzabili(app):
+    with pytest.raises(TypeError):
+        app.json.dumps({'a': object()})
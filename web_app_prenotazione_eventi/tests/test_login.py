@@ -0,0 +1,33 @@
+import pytest
+
+
+def login_errati(client, numero, ip, inizio=0):
+    # Email sempre diverse: scatta solo il limite per IP
+    stati = []
+    for indice in range(inizio, inizio + numero):
+        risposta = client.post(
+            '/login', data={'email': f'utente{indice}@example.com', 'password': 'sbagliata'},
+            headers={'X-Forwarded-For': ip}
+        )
+        stati.append(risposta.status_code)
+    return stati
+
+
+@pytest.fixture
+def limite_ip(monkeypatch):
+    monkeypatch.setattr('app.LOGIN_LIMITE_IP', 3)
+    return 3
+
+
+@pytest.mark.parametrize('config_app', [{'PROXY_FIDATI': 1}])
+def test_client_dietro_lo_stesso_proxy_contati_separatamente(client, limite_ip):
+    assert login_errati(client, limite_ip, '10.0.0.1') == [200] * limite_ip
+    assert login_errati(client, 1, '10.0.0.1', inizio=10) == [429]
+    # Stesso proxy (stesso remote_addr del socket), passeggero diverso
+    assert login_errati(client, 1, '10.0.0.2', inizio=20) == [200]
+
+
+def test_senza_proxy_fidati_x_forwarded_for_ignorato(client, limite_ip):
+    # Cambiare l'intestazione non aggira il limite: conta l'indirizzo della connessione
+    assert login_errati(client, limite_ip, '10.0.0.1') == [200] * limite_ip
+    assert login_errati(client, 1, '10.0.0.2', inizio=10) == [429]
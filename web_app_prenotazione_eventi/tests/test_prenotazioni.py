@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from models import db, Evento, Locale, Replica, Utente, Prenotazione
+
+
+def crea_prenotazioni(utente_id, numero):
+    # Ogni prenotazione su un evento, un locale e una replica diversi: il caricamento
+    # lazy delle relazioni costerebbe qualche query in più per ogni riga
+    inizio = datetime(2030, 1, 1, 21, 0)
+    for indice in range(numero):
+        locale = Locale(nome_locale=f'Locale {indice}', luogo='Roma', posti=100)
+        evento = Evento(rel_locale=locale, nome_evento=f'Evento {indice}')
+        replica = Replica(rel_evento=evento, data_ora=inizio + timedelta(days=indice))
+        db.session.add(Prenotazione(utente_id=utente_id, rel_replica=replica, quantita=2))
+    db.session.commit()
+
+
+def query_per_richiesta(client, percorso):
+    conteggio = []
+    registra = lambda *args: conteggio.append(args[2])
+    event.listen(db.engine, 'before_cursor_execute', registra)
+    try:
+        risposta = client.get(percorso)
+        # Il corpo è generato a flusso: le query partono mentre lo si legge
+        dati = risposta.get_json()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', registra)
+    assert risposta.status_code == 200
+    return len(conteggio), dati
+
+
+@pytest.fixture
+def utente(client):
+    utente = Utente(nome='Ada', cognome='Rossi', email='ada@example.com', password='x')
+    db.session.add(utente)
+    db.session.commit()
+    with client.session_transaction() as sessione:
+        sessione['user_id'] = utente.id
+    return utente
+
+
+def test_query_costanti_al_crescere_delle_prenotazioni(client, utente):
+    crea_prenotazioni(utente.id, 1)
+    query_una, dati = query_per_richiesta(client, '/api/prenotazioni?limit=100')
+    assert len(dati['prenotazioni']) == 1
+
+    crea_prenotazioni(utente.id, 49)
+    query_molte, dati = query_per_richiesta(client, '/api/prenotazioni?limit=100')
+    assert len(dati['prenotazioni']) == 50
+    assert query_molte == query_una
+
+
+
+def test_cursore_valido_dopo_la_cancellazione(client, utente):
+    crea_prenotazioni(utente.id, 5)
+    _, prima = query_per_richiesta(client, '/api/prenotazioni?limit=3')
+    assert [p['evento'] for p in prima['prenotazioni']] == ['Evento 0', 'Evento 1', 'Evento 2']
+
+    # L'ultima prenotazione della pagina sparisce (per esempio da un'altra scheda)
+    Prenotazione.query.filter_by(id=prima['prenotazioni'][-1]['id']).delete()
+    db.session.commit()
+    _, seconda = query_per_richiesta(client, '/api/prenotazioni?limit=3&after=' + prima['next'])
+    assert [p['evento'] for p in seconda['prenotazioni']] == ['Evento 3', 'Evento 4']
+    assert seconda['next'] is None
+
+
+def test_cursore_non_valido(client, utente):
+    assert client.get('/api/prenotazioni?after=42').status_code == 400
+
+
+def test_risposta_privata_e_rivalidata(client, utente):
+    crea_prenotazioni(utente.id, 1)
+    risposta = client.get('/api/prenotazioni')
+    assert risposta.headers['Cache-Control'] == 'private, no-cache'
+    non_modificata = client.get('/api/prenotazioni', headers={'If-None-Match': risposta.headers['ETag']})
+    assert non_modificata.status_code == 304
+    assert non_modificata.headers['Cache-Control'] == 'private, no-cache'
@@ -0,0 +1,101 @@
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import case
+from sqlalchemy.dialects.sqlite import insert
+from models import db, TentativoLogin
+from engine import esegui_transazione
+
+
+def stima_finestra(finestra, ora, indice, corrente, precedente):
+    # Finestra scorrevole approssimata con due contatori: il conteggio della finestra precedente
+    # pesa per la parte di essa ancora compresa negli ultimi "finestra" secondi
+    attuale = int(ora // finestra)
+    peso = 1 - (ora - attuale * finestra) / finestra
+    if indice == attuale:
+        return corrente + precedente * peso
+    if indice == attuale - 1:
+        return corrente * peso
+    return 0
+
+
+class FinestraScorrevole:
+    # Contatori in memoria del processo: tre numeri per chiave, ordinati per ultima scrittura.
+    # Le chiavi ferme da più di due finestre valgono zero e si eliminano dalla testa
+    def __init__(self, finestra):
+        self.finestra = finestra
+        self.contatori = OrderedDict()
+        self.lock = threading.Lock()
+
+    def stima(self, chiave):
+        with self.lock:
+            valori = self.contatori.get(chiave)
+        if valori is None:
+            return 0
+        return stima_finestra(self.finestra, time.time(), *valori)
+
+    def registra(self, chiave):
+        ora = time.time()
+        attuale = int(ora // self.finestra)
+        with self.lock:
+            indice, corrente, precedente = self.contatori.pop(chiave, (attuale, 0, 0))
+            if indice == attuale - 1:
+                indice, corrente, precedente = attuale, 0, corrente
+            elif indice != attuale:
+                indice, corrente, precedente = attuale, 0, 0
+            self.contatori[chiave] = (indice, corrente + 1, precedente)
+            while self.contatori:
+                prima = next(iter(self.contatori))
+                if self.contatori[prima][0] >= attuale - 1:
+                    break
+                del self.contatori[prima]
+
+    def azzera(self, chiave):
+        with self.lock:
+            self.contatori.pop(chiave, None)
+
+
+class FinestraScorrevoleSQLite:
+    # Stessi contatori nella tabella tentativi_login, condivisa tra i worker.
+    # Il passaggio di finestra avviene nell'upsert, sui valori della riga esistente
+    def __init__(self, finestra, pulizia_ogni=100):
+        self.finestra = finestra
+        self.pulizia_ogni = pulizia_ogni
+        self.scritture = 0
+
+    def stima(self, chiave):
+        riga = (
+            db.session.query(TentativoLogin.indice, TentativoLogin.corrente, TentativoLogin.precedente)
+            .filter(TentativoLogin.chiave == chiave)
+            .first()
+        )
+        if riga is None:
+            return 0
+        return stima_finestra(self.finestra, time.time(), *riga)
+
+    def registra(self, chiave):
+        attuale = int(time.time() // self.finestra)
+        self.scritture += 1
+        esegui_transazione(self.upsert, chiave, attuale, self.scritture % self.pulizia_ogni == 0)
+
+    def upsert(self, chiave, attuale, pulizia):
+        istruzione = insert(TentativoLogin).values(chiave=chiave, indice=attuale, corrente=1, precedente=0)
+        db.session.execute(istruzione.on_conflict_do_update(
+            index_elements=[TentativoLogin.chiave],
+            set_={
+                'precedente': case(
+                    (TentativoLogin.indice == attuale, TentativoLogin.precedente),
+                    (TentativoLogin.indice == attuale - 1, TentativoLogin.corrente),
+                    else_=0
+                ),
+                'corrente': case((TentativoLogin.indice == attuale, TentativoLogin.corrente + 1), else_=1),
+                'indice': attuale
+            }
+        ))
+        if pulizia:
+            db.session.query(TentativoLogin).filter(TentativoLogin.indice < attuale - 1).delete(synchronize_session=False)
+
+    def azzera(self, chiave):
+        esegui_transazione(
+            lambda: db.session.query(TentativoLogin).filter(TentativoLogin.chiave == chiave).delete(synchronize_session=False)
+        )